@@ -1,10 +1,143 @@
 # count_docs.py
-from firebase_admin import credentials, initialize_app, firestore
+"""
+Count documents per collection without downloading them.
 
-cred = credentials.Certificate("serviceAccountKey.json")
-initialize_app(cred)
-db = firestore.client()
+Uses Firestore server-side aggregation (COUNT) queries, run concurrently across
+collections. Engines without aggregation support (older emulators, local fakes)
+fall back to a keys-only, paginated scan.
 
-for coll in ['recipes','users','interactions']:
-    docs = list(db.collection(coll).stream())
-    print(coll, "count =", len(docs))
+Examples:
+    python count_docs.py
+    python count_docs.py --collections interactions --type like --type view
+    python count_docs.py --collections interactions --since 2025-11-10T00:00:00Z
+    python count_docs.py --scan --page-size 1000
+
+Set FIRESTORE_EMULATOR_HOST to count against the local emulator.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from firestore_client import get_db
+
+COLLECTIONS = ["recipes", "users", "interactions"]
+DEFAULT_PAGE_SIZE = 500
+# the reserved field path of the document id (what FieldPath.document_id() returns);
+# a string, so the scan does not need firebase_admin and works against local fakes
+DOC_ID_FIELD = "__name__"
+
+def build_query(db, collection_name, itype=None, since=None, until=None):
+    """
+    Collection query with optional filters. Interaction timestamps are stored as
+    ISO-8601 strings, so range filters compare them lexicographically.
+    """
+    query = db.collection(collection_name)
+    if itype:
+        query = query.where("type", "==", itype)
+    if since:
+        query = query.where("timestamp", ">=", since)
+    if until:
+        query = query.where("timestamp", "<", until)
+    return query
+
+def aggregate_count(query):
+    """Server-side COUNT aggregation; only the number crosses the wire."""
+    result = query.count(alias="n").get()
+    # result is a list of aggregation result lists (one per aggregation query)
+    return int(result[0][0].value)
+
+def scan_count(query, page_size=DEFAULT_PAGE_SIZE, range_field=None, doc_id_field=DOC_ID_FIELD):
+    """
+    Fallback: keys-only paginated scan. The projection on the document id means only
+    document names are returned, not field data. When the query has a range filter,
+    Firestore requires ordering by that field first, so it is projected as well to
+    serve as the page cursor.
+    """
+    doc_id = doc_id_field
+    if range_field:
+        base = query.select([range_field, doc_id]).order_by(range_field).order_by(doc_id)
+    else:
+        base = query.select([doc_id]).order_by(doc_id)
+    base = base.limit(page_size)
+    total = 0
+    last = None
+    while True:
+        page_query = base.start_after(last) if last is not None else base
+        page = list(page_query.stream())
+        total += len(page)
+        if len(page) < page_size:
+            return total
+        last = page[-1]
+
+def _unsupported_errors():
+    """Errors that mean "no aggregation support": AttributeError on fakes, UNIMPLEMENTED on old emulators."""
+    errors = (AttributeError, NotImplementedError)
+    try:
+        from google.api_core.exceptions import MethodNotImplemented  # gRPC UNIMPLEMENTED
+    except ImportError:
+        return errors
+    return errors + (MethodNotImplemented,)
+
+def count_query(query, use_scan=False, page_size=DEFAULT_PAGE_SIZE, range_field=None, doc_id_field=DOC_ID_FIELD):
+    """
+    Returns (count, method). Only missing aggregation support falls back to the scan;
+    other failures (permission denied, deadline exceeded, network) are raised.
+    """
+    if not use_scan:
+        try:
+            return aggregate_count(query), "aggregate"
+        except _unsupported_errors() as e:
+            print(f"Aggregation unavailable ({type(e).__name__}: {e}); falling back to keys-only scan")
+    return scan_count(query, page_size=page_size, range_field=range_field, doc_id_field=doc_id_field), "scan"
+
+def count_all(db, collections=COLLECTIONS, types=None, since=None, until=None,
+              use_scan=False, page_size=DEFAULT_PAGE_SIZE, workers=None, doc_id_field=DOC_ID_FIELD):
+    """
+    Run one count per (collection, type) concurrently.
+    Type filters only apply to the interactions collection.
+    Returns a list of dicts: {collection, type, count, method}.
+    """
+    jobs = []
+    for coll in collections:
+        if coll == "interactions" and types:
+            for t in types:
+                jobs.append((coll, t))
+        else:
+            jobs.append((coll, None))
+
+    def run(job):
+        coll, itype = job
+        has_range = coll == "interactions" and bool(since or until)
+        query = build_query(db, coll, itype=itype,
+                            since=since if has_range else None,
+                            until=until if has_range else None)
+        n, method = count_query(query, use_scan=use_scan, page_size=page_size,
+                                range_field="timestamp" if has_range else None,
+                                doc_id_field=doc_id_field)
+        return {"collection": coll, "type": itype, "count": n, "method": method}
+
+    with ThreadPoolExecutor(max_workers=workers or len(jobs)) as pool:
+        return list(pool.map(run, jobs))
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Count Firestore documents per collection.")
+    ap.add_argument("--collections", nargs="+", default=COLLECTIONS)
+    ap.add_argument("--type", dest="types", action="append", help="interaction type filter (repeatable)")
+    ap.add_argument("--since", help="interactions with timestamp >= this ISO-8601 value")
+    ap.add_argument("--until", help="interactions with timestamp < this ISO-8601 value")
+    ap.add_argument("--scan", action="store_true", help="skip aggregation and use the keys-only scan")
+    ap.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    ap.add_argument("--workers", type=int, default=None)
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    db = get_db()
+    results = count_all(db, collections=args.collections, types=args.types,
+                        since=args.since, until=args.until, use_scan=args.scan,
+                        page_size=args.page_size, workers=args.workers)
+    for r in results:
+        label = r["collection"] if r["type"] is None else f'{r["collection"]}[type={r["type"]}]'
+        print(label, "count =", r["count"], f'({r["method"]})')
+
+if __name__ == "__main__":
+    main()
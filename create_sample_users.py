@@ -1,10 +1,6 @@
 # create_sample_users.py
-from firebase_admin import credentials, initialize_app, firestore
-
-SERVICE_ACCOUNT_PATH = "serviceAccountKey.json"
-cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-initialize_app(cred)
-db = firestore.client()
+import argparse
+from firestore_client import get_db
 
 users = [
     {"user_id":"user_kunal","name":"Kunal Morankar","email":"kunal@example.com","signup_date":"2024-08-01T12:00:00Z","country":"India"},
@@ -19,8 +15,14 @@ users = [
     {"user_id":"user_maya","name":"Maya Gomez","email":"maya@example.com","signup_date":"2025-08-30T13:00:00Z","country":"Mexico"},
 ]
 
-for u in users:
-    db.collection("users").document(u["user_id"]).set(u)
-    print("Created user:", u["user_id"])
+def main(argv=None):
+    argparse.ArgumentParser(description="Create the sample users in Firestore.").parse_args(argv)
+    db = get_db()
+    for u in users:
+        db.collection("users").document(u["user_id"]).set(u)
+        print("Created user:", u["user_id"])
+
+    print("Done creating users.")
 
-print("Done creating users.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# dedup.py
+"""
+Interaction deduplication for the transform.
+
+Duplicate events come from retried writes of the same payload (Firestore add()
+creates a new auto id each time, the interaction_id and content stay the same).
+seed_interactions.py, however, numbers interaction_id from int-0001 on every run
+with a new random payload, so an id alone does not identify an event.
+
+Key per interaction: its interaction_id (or "fp-<fingerprint>" when the payload
+has none; the Firestore document id is not used, since every retried add() gets
+a new one) plus a content fingerprint of (user_id, recipe_id, type, timestamp). A row is a
+duplicate only when both match an earlier row; rows that share an id with
+different content are kept and reported as id conflicts.
+
+Within one run duplicates are dropped exactly with a hash set. Across incremental
+runs an optional Bloom filter, persisted to disk, remembers keys already emitted
+(see remember_interactions). A Bloom filter has no false negatives but may report
+an unseen key as seen (at roughly the configured error rate), so only enable it
+for incremental exports that contain new events.
+"""
+
+import hashlib
+import math
+import struct
+from pathlib import Path
+
+DEFAULT_CAPACITY = 1_000_000
+DEFAULT_ERROR_RATE = 0.001
+
+def interaction_fingerprint(user_id, recipe_id, itype, timestamp):
+    parts = ["" if v is None or v != v else str(v) for v in (user_id, recipe_id, itype, timestamp)]
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+class BloomFilter:
+    _MAGIC = b"RLBF1"
+    _HEADER = struct.Struct("<5sQIQ")  # magic, n_bits, n_hashes, n_added
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE, n_bits=None, n_hashes=None):
+        if n_bits is None:
+            n_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        if n_hashes is None:
+            n_hashes = max(1, int(round(n_bits / capacity * math.log(2))))
+        self.n_bits = n_bits
+        self.n_hashes = n_hashes
+        self.n_added = 0
+        self.bits = bytearray((n_bits + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing (Kirsch-Mitzenmacher): h1 + i*h2
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        h2 |= 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.n_added += 1
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(self._HEADER.pack(self._MAGIC, self.n_bits, self.n_hashes, self.n_added))
+            f.write(self.bits)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            magic, n_bits, n_hashes, n_added = cls._HEADER.unpack(f.read(cls._HEADER.size))
+            if magic != cls._MAGIC:
+                raise ValueError(f"{path} is not a Bloom filter file")
+            bloom = cls(n_bits=n_bits, n_hashes=n_hashes)
+            bloom.n_added = n_added
+            bloom.bits = bytearray(f.read())
+        if len(bloom.bits) != (n_bits + 7) // 8:
+            raise ValueError(f"{path} is truncated")
+        return bloom
+
+    @classmethod
+    def load_or_create(cls, path, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        if Path(path).exists():
+            return cls.load(path)
+        return cls(capacity=capacity, error_rate=error_rate)
+
+def interaction_keys(df):
+    """Dedup keys (interaction_id + content fingerprint) of a normalized interactions DataFrame."""
+    return [
+        f"{i}\x1f{interaction_fingerprint(u, r, t, ts)}"
+        for i, u, r, t, ts in df[["interaction_id", "user_id", "recipe_id", "type", "timestamp"]].itertuples(index=False)
+    ]
+
+def deduplicate_interactions(df, bloom=None):
+    """
+    Drop duplicate interactions from a normalized interactions DataFrame.
+    Rows without an interaction_id get "fp-<fingerprint>" as their id. The Bloom
+    filter is only read here; add the rows that were actually written with
+    remember_interactions() once the output is committed.
+    Returns (deduplicated DataFrame, stats dict).
+    """
+    rows_in = len(df)
+    df = df.copy()
+    missing = df["interaction_id"].isna() | (df["interaction_id"].astype(str) == "")
+    if missing.any():
+        df.loc[missing, "interaction_id"] = [
+            "fp-" + interaction_fingerprint(u, r, t, ts)
+            for u, r, t, ts in df.loc[missing, ["user_id", "recipe_id", "type", "timestamp"]].itertuples(index=False)
+        ]
+
+    # exact in-run dedup (hash tables over ids and keys), keeps the first occurrence
+    seen_ids = set()
+    seen_keys = set()
+    conflict_ids = []
+    keep = []
+    for iid, key in zip(df["interaction_id"], interaction_keys(df)):
+        if key in seen_keys:
+            keep.append(False)
+            continue
+        if iid in seen_ids:
+            conflict_ids.append(iid)
+        keep.append(True)
+        seen_ids.add(iid)
+        seen_keys.add(key)
+    in_run_dupes = len(keep) - sum(keep)
+    df = df[keep]
+
+    seen_before = 0
+    if bloom is not None:
+        keep = [key not in bloom for key in interaction_keys(df)]
+        seen_before = len(keep) - sum(keep)
+        df = df[keep]
+
+    stats = {
+        "rows_in": rows_in,
+        "missing_id_fingerprinted": int(missing.sum()),
+        "dropped_in_run": in_run_dupes,
+        "dropped_seen_before": seen_before,
+        "id_conflicts": len(conflict_ids),
+        "id_conflict_examples": sorted(set(map(str, conflict_ids)))[:5],
+        "rows_out": len(df),
+    }
+    return df, stats
+
+def remember_interactions(bloom, df):
+    """Mark the rows of df (as returned by deduplicate_interactions) as emitted."""
+    for key in interaction_keys(df):
+        bloom.add(key)
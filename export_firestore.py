@@ -1,36 +1,83 @@
 # export_firestore.py
+"""
+Export Firestore collections to exported_json/.
+
+By default each collection is streamed in document-id order into compressed
+JSON-lines shards with a manifest (see export_shards.py):
+    exported_json/<collection>/part-<run>-NNNNN.jsonl.gz + manifest.json
+--json writes the older single pretty-printed exported_json/<collection>.json instead.
+"""
+
+import argparse
 import json
-from firebase_admin import credentials, initialize_app, firestore
 from pathlib import Path
+from firestore_client import get_db
+from pipeline_metrics import MetricsRecorder
+from export_shards import MANIFEST, MAX_SHARD_BYTES, MAX_SHARD_ROWS, ShardWriter
 
-SERVICE_ACCOUNT_PATH = "serviceAccountKey.json"
 OUTPUT_DIR = Path("exported_json")
 COLLECTIONS = ["recipes", "users", "interactions"]
 
-def init_firestore():
-    cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-    initialize_app(cred)
-    return firestore.client()
+metrics = MetricsRecorder("export")
 
-def export_collection(db, collection_name):
-    docs = []
-    for doc in db.collection(collection_name).stream():
+def iter_collection(db, collection_name):
+    """Documents in document-id order, each with its id as `_doc_id`."""
+    from firebase_admin import firestore
+    query = db.collection(collection_name).order_by(firestore.FieldPath.document_id())
+    for doc in query.stream():
         d = doc.to_dict() or {}
         # keep Firestore doc id too (useful if doc doesn't include recipe_id)
         d["_doc_id"] = doc.id
-        docs.append(d)
-    return docs
+        yield d
 
-def main():
-    db = init_firestore()
-    OUTPUT_DIR.mkdir(exist_ok=True)
-    for coll in COLLECTIONS:
-        print(f"Exporting collection: {coll}")
+def export_collection(db, collection_name):
+    return list(iter_collection(db, collection_name))
+
+def export_json(db, coll):
+    with metrics.stage("stream") as sub:
         docs = export_collection(db, coll)
-        out_file = OUTPUT_DIR / f"{coll}.json"
+        sub.rows_out = len(docs)
+    out_file = OUTPUT_DIR / f"{coll}.json"
+    stale = OUTPUT_DIR / coll / MANIFEST
+    if stale.exists():
+        stale.unlink()  # readers prefer a manifest over <coll>.json
+    with metrics.stage("write_json", rows_in=len(docs)):
         with out_file.open("w", encoding="utf-8") as f:
             json.dump(docs, f, ensure_ascii=False, indent=2)
-        print(f" -> wrote {len(docs)} documents to {out_file}")
+    print(f" -> wrote {len(docs)} documents to {out_file}")
+    return len(docs)
+
+def export_sharded(db, coll, max_rows=MAX_SHARD_ROWS, max_bytes=MAX_SHARD_BYTES):
+    # streamed straight into the shards, the collection is never held in memory
+    with metrics.stage("stream_write_shards") as sub:
+        writer = ShardWriter(coll, OUTPUT_DIR, max_rows=max_rows, max_bytes=max_bytes)
+        for doc in iter_collection(db, coll):
+            writer.add(doc)
+        manifest = writer.close()
+        sub.rows_out = manifest["rows"]
+    size = sum(s["bytes"] for s in manifest["shards"])
+    print(f" -> wrote {manifest['rows']} documents to {len(manifest['shards'])} shard(s) "
+          f"({size} bytes) in {OUTPUT_DIR / coll}")
+    return manifest["rows"]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Export Firestore collections to exported_json/.")
+    ap.add_argument("--json", action="store_true", help="write one <collection>.json per collection (old format)")
+    ap.add_argument("--shard-rows", type=int, default=MAX_SHARD_ROWS, help="max documents per shard")
+    ap.add_argument("--shard-mb", type=float, default=MAX_SHARD_BYTES / 2**20, help="max uncompressed MB per shard")
+    args = ap.parse_args(argv)
+    metrics.reset()
+    db = get_db()
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    for coll in COLLECTIONS:
+        print(f"Exporting collection: {coll}")
+        with metrics.stage(coll) as st:
+            if args.json:
+                st.rows_out = export_json(db, coll)
+            else:
+                st.rows_out = export_sharded(db, coll, args.shard_rows, int(args.shard_mb * 2**20))
+    metrics.print_summary()
+    metrics.write()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,274 @@
+# export_shards.py
+"""
+Sharded export format and its reader.
+
+Each collection is written as size-bounded, gzip-compressed JSON-lines shards
+ordered by Firestore document id, plus a manifest:
+
+    exported_json/<collection>/part-<run>-00000.jsonl.gz
+    exported_json/<collection>/part-<run>-00001.jsonl.gz
+    exported_json/<collection>/manifest.json
+
+Every export writes its shards under new names (<run> is random per export) and
+swaps in the manifest atomically when it is complete; the previous shards are
+deleted only after that. An export that fails partway therefore leaves the
+previous export readable, and its stray shards are removed by the next one.
+
+The manifest lists, per shard: rows, compressed bytes, sha256 of the file and the
+min/max document id (`_doc_id`). Readers can therefore
+ - hand whole shards to workers (load_collection(..., workers=4)),
+ - skip shards outside the key range they need (key_min / key_max),
+ - check integrity from file sizes and checksums without decoding any JSON
+   (verify_manifest).
+
+Collections exported before this format existed (one exported_json/<collection>.json
+file) are still read by load_collection().
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from records import add_parse_timing, loads, parse_timing
+
+EXPORT_DIR = Path("exported_json")
+KEY_FIELD = "_doc_id"
+MAX_SHARD_ROWS = 100_000
+MAX_SHARD_BYTES = 64 * 1024 * 1024  # uncompressed JSON per shard
+MANIFEST = "manifest.json"
+FORMAT = "jsonl.gz/v1"
+
+class _HashingFile:
+    """File wrapper that hashes and counts the (compressed) bytes as they are written."""
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+class ShardWriter:
+    """
+    Writes one collection's shards; call add(doc) per document (in key order) and
+    close() at the end, which writes the manifest. The manifest is written last,
+    so a reader never sees a half-written export: until then it still reads the
+    previous manifest and shards, which close() removes afterwards.
+    """
+    def __init__(self, collection, out_dir=EXPORT_DIR, max_rows=MAX_SHARD_ROWS, max_bytes=MAX_SHARD_BYTES):
+        self.collection = collection
+        self.dir = Path(out_dir) / collection
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.shards = []
+        self._current = None
+        self.run = uuid.uuid4().hex[:8]
+
+    def _open(self):
+        path = self.dir / f"part-{self.run}-{len(self.shards):05d}.jsonl.gz"
+        raw = open(path.with_suffix(".gz.tmp"), "wb")
+        hashed = _HashingFile(raw)
+        # mtime=0 keeps the bytes (and checksum) identical for identical data
+        gz = gzip.GzipFile(filename="", mode="wb", fileobj=hashed, mtime=0)
+        self._current = {"path": path, "raw": raw, "hashed": hashed, "gz": gz,
+                         "rows": 0, "json_bytes": 0, "min_key": None, "max_key": None}
+
+    def _close_current(self):
+        cur = self._current
+        if cur is None:
+            return
+        cur["gz"].close()
+        cur["raw"].close()
+        os.replace(cur["raw"].name, cur["path"])
+        self.shards.append({
+            "file": cur["path"].name,
+            "rows": cur["rows"],
+            "bytes": cur["hashed"].bytes,
+            "sha256": cur["hashed"].sha256.hexdigest(),
+            "min_key": cur["min_key"],
+            "max_key": cur["max_key"],
+        })
+        self._current = None
+
+    def add(self, doc):
+        line = (json.dumps(doc, ensure_ascii=False) + "\n").encode("utf-8")
+        cur = self._current
+        if cur is not None and (cur["rows"] >= self.max_rows or cur["json_bytes"] + len(line) > self.max_bytes):
+            self._close_current()
+            cur = None
+        if cur is None:
+            self._open()
+            cur = self._current
+        cur["gz"].write(line)
+        cur["rows"] += 1
+        cur["json_bytes"] += len(line)
+        key = doc.get(KEY_FIELD)
+        if key is not None:
+            key = str(key)
+            cur["min_key"] = key if cur["min_key"] is None else min(cur["min_key"], key)
+            cur["max_key"] = key if cur["max_key"] is None else max(cur["max_key"], key)
+
+    def close(self):
+        self._close_current()
+        manifest = {
+            "collection": self.collection,
+            "format": FORMAT,
+            "key": KEY_FIELD,
+            "rows": sum(s["rows"] for s in self.shards),
+            "shards": self.shards,
+        }
+        tmp = self.dir / (MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        tmp.replace(self.dir / MANIFEST)
+        # only now are the previous export's shards (and leftovers of failed ones) unreferenced
+        current = {s["file"] for s in self.shards}
+        for old in list(self.dir.glob("part-*.jsonl.gz")) + list(self.dir.glob("part-*.tmp")):
+            if old.name not in current:
+                old.unlink()
+        return manifest
+
+def write_collection(collection, docs, out_dir=EXPORT_DIR, max_rows=MAX_SHARD_ROWS, max_bytes=MAX_SHARD_BYTES):
+    writer = ShardWriter(collection, out_dir, max_rows=max_rows, max_bytes=max_bytes)
+    for doc in docs:
+        writer.add(doc)
+    return writer.close()
+
+# Reading
+
+def load_manifest(collection, base=EXPORT_DIR):
+    """The collection's manifest, or None if it was exported in the single-file format."""
+    p = Path(base) / collection / MANIFEST
+    if not p.exists():
+        return None
+    return json.load(open(p, "r", encoding="utf-8"))
+
+def select_shards(manifest, key_min=None, key_max=None):
+    """Shards whose [min_key, max_key] overlaps [key_min, key_max] (bounds inclusive)."""
+    selected = []
+    for s in manifest["shards"]:
+        if s["min_key"] is not None:
+            if key_min is not None and s["max_key"] < key_min:
+                continue
+            if key_max is not None and s["min_key"] > key_max:
+                continue
+        selected.append(s)
+    return selected
+
+def read_shard(path, key_min=None, key_max=None, decode=None):
+    """Documents of one shard; decode (e.g. records.decode_recipe) is applied to each."""
+    ranged = key_min is not None or key_max is not None
+    docs = []
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            doc = loads(line)
+            if ranged and not _in_range(doc.get(KEY_FIELD), key_min, key_max):
+                continue
+            docs.append(decode(doc) if decode else doc)
+    return docs
+
+def _read_shard_in_worker(path, key_min, key_max, decode):
+    # decode timing (records.parse_timing) accumulates in the worker; hand it back
+    parse_timing(reset=True)
+    docs = read_shard(path, key_min, key_max, decode)
+    return docs, parse_timing(reset=True)
+
+def _in_range(key, key_min, key_max):
+    if key is None:
+        return False
+    key = str(key)
+    return (key_min is None or key >= key_min) and (key_max is None or key <= key_max)
+
+def load_collection(collection, base=EXPORT_DIR, key_min=None, key_max=None, workers=1, decode=None):
+    """
+    All documents of an exported collection, in shard order, as dicts or as
+    decode(dict) (see records.py). Shards are decoded in `workers` processes when
+    workers > 1. Falls back to <collection>.json when there is no manifest; raises
+    FileNotFoundError when neither exists.
+    """
+    manifest = load_manifest(collection, base)
+    if manifest is None:
+        p = Path(base) / f"{collection}.json"
+        if not p.exists():
+            raise FileNotFoundError(f"{p} not found. Run export_firestore.py first.")
+        docs = loads(p.read_bytes())
+        if key_min is not None or key_max is not None:
+            docs = [d for d in docs if _in_range(d.get(KEY_FIELD), key_min, key_max)]
+        return [decode(d) for d in docs] if decode else docs
+    paths = [Path(base) / collection / s["file"] for s in select_shards(manifest, key_min, key_max)]
+    if workers and workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            n = len(paths)
+            parts = []
+            for docs, timing in pool.map(_read_shard_in_worker, paths, [key_min] * n, [key_max] * n, [decode] * n):
+                parts.append(docs)
+                add_parse_timing(timing)
+    else:
+        parts = [read_shard(p, key_min, key_max, decode) for p in paths]
+    return [d for part in parts for d in part]
+
+def verify_manifest(collection, base=EXPORT_DIR, checksums=True):
+    """
+    Problems found in a sharded export (empty list when it is intact). File sizes are
+    checked with stat(); checksums=True also hashes the compressed files (the JSON is
+    never decoded).
+    """
+    manifest = load_manifest(collection, base)
+    if manifest is None:
+        return [f"{collection}: no {MANIFEST}"]
+    problems = []
+    for s in manifest["shards"]:
+        p = Path(base) / collection / s["file"]
+        if not p.exists():
+            problems.append(f"{p}: missing")
+            continue
+        size = p.stat().st_size
+        if size != s["bytes"]:
+            problems.append(f"{p}: {size} bytes, manifest says {s['bytes']}")
+            continue
+        if checksums:
+            h = hashlib.sha256()
+            with open(p, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            if h.hexdigest() != s["sha256"]:
+                problems.append(f"{p}: sha256 mismatch")
+    if sum(s["rows"] for s in manifest["shards"]) != manifest["rows"]:
+        problems.append(f"{collection}: shard rows do not add up to {manifest['rows']}")
+    return problems
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Inspect / verify sharded exports under exported_json/.")
+    ap.add_argument("collections", nargs="*", default=["recipes", "users", "interactions"])
+    ap.add_argument("--quick", action="store_true", help="check file sizes only, skip checksums")
+    args = ap.parse_args(argv)
+    failed = False
+    for coll in args.collections:
+        manifest = load_manifest(coll)
+        if manifest is None:
+            print(f"{coll}: single-file export (no manifest)")
+            continue
+        problems = verify_manifest(coll, checksums=not args.quick)
+        size = sum(s["bytes"] for s in manifest["shards"])
+        print(f"{coll}: {manifest['rows']} rows in {len(manifest['shards'])} shard(s), {size} bytes -> "
+              + ("OK" if not problems else f"{len(problems)} problem(s)"))
+        for p in problems:
+            print("  ", p)
+        failed |= bool(problems)
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# firestore_client.py
+"""
+Shared, lazily created Firestore client.
+
+firebase_admin is only imported (and the app only initialized) the first time
+get_db() is called, so scripts that never touch Firestore do not pay for it and
+several steps run in one process share a single client.
+
+Set FIRESTORE_EMULATOR_HOST to talk to the local emulator; the service account
+key is then optional.
+"""
+
+import os
+from pathlib import Path
+
+SERVICE_ACCOUNT_PATH = "serviceAccountKey.json"
+
+_db = None
+
+def get_db():
+    global _db
+    if _db is None:
+        from firebase_admin import credentials, initialize_app, firestore
+        if Path(SERVICE_ACCOUNT_PATH).exists() or not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+            initialize_app(credentials.Certificate(SERVICE_ACCOUNT_PATH))
+        else:
+            project_id = os.environ.get("GCLOUD_PROJECT", "recipelab-emulator")
+            initialize_app(options={"projectId": project_id})
+        _db = firestore.client()
+    return _db
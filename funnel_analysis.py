@@ -0,0 +1,216 @@
+# funnel_analysis.py
+"""
+Per-user funnel and session analytics over normalized interactions.
+
+Unlike insight 8 in generate_insights.py (per-recipe totals), a view only counts
+as converted when the *same user* goes on to like / attempt / rate the *same
+recipe* within a time window of that view:
+
+    view -> like -> attempt -> rating   (each step after the previous one,
+                                          all within FUNNEL_WINDOW of the view)
+
+Sessions are runs of one user's events separated by less than SESSION_GAP.
+
+Everything is computed on sorted NumPy arrays (one sort by (user_id, timestamp),
+a stable re-sort by (user, recipe) and searchsorted lookups for the next event of
+each stage), with no Python loop per user or per event, so the cost is
+O(n log n) in the number of events.
+
+Writes:
+ - funnel_by_recipe.csv
+ - funnel_by_cohort.csv   (cohort = signup month from users)
+ - sessions_summary.json
+"""
+
+import argparse
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from pipeline_metrics import MetricsRecorder
+from table_loader import read_table
+from records import load_records
+
+BASE = Path("normalized_csv")
+EXPORT_DIR = Path("exported_json")
+OUT = Path("analysis_output")
+
+SESSION_GAP = pd.Timedelta(minutes=30)
+FUNNEL_WINDOW = pd.Timedelta(days=1)
+FUNNEL_STAGES = ["view", "like", "attempt", "rating"]
+
+metrics = MetricsRecorder("funnel")
+
+def load_events(base=BASE):
+    """Interactions with a known user and a parseable timestamp (anonymous events cannot be attributed)."""
+    df = read_table("interactions", ["user_id", "recipe_id", "type", "timestamp"], base=base)
+    df = df.rename(columns={"timestamp": "ts"})
+    return df[df["user_id"].notna() & df["recipe_id"].notna() & df["ts"].notna()].reset_index(drop=True)
+
+def load_user_cohorts(base=EXPORT_DIR):
+    """user_id -> signup month ("YYYY-MM"), from the users export."""
+    try:
+        users = load_records("users", base=base)
+    except FileNotFoundError:
+        return pd.Series(dtype=object)
+    signup = pd.to_datetime(pd.Series([u.signup_date for u in users], dtype=object),
+                            format="ISO8601", utc=True, errors="coerce")
+    cohort = signup.dt.strftime("%Y-%m")
+    return pd.Series(cohort.values, index=[u.user_id for u in users]).dropna()
+
+def _epoch_ns(ts):
+    """UTC timestamps as int64 nanoseconds, whatever resolution pandas parsed them at."""
+    return ts.dt.tz_convert(None).astype("datetime64[ns]").to_numpy().view("int64")
+
+def _type_code(types, name):
+    """Category code of an interaction type; -2 (matches no row, not even missing ones) if absent."""
+    try:
+        return types.cat.categories.get_loc(name)
+    except KeyError:
+        return -2
+
+def sessionize(events, gap=SESSION_GAP):
+    """
+    Sort events once by (user, timestamp) and assign session ids.
+    Returns the sorted frame with a `session_id` column.
+    """
+    user = events["user_id"].cat.codes.to_numpy()
+    ts = _epoch_ns(events["ts"])
+    order = np.lexsort((ts, user))
+    user, ts = user[order], ts[order]
+
+    new_session = np.ones(len(order), dtype=bool)
+    if len(order) > 1:
+        new_session[1:] = (user[1:] != user[:-1]) | ((ts[1:] - ts[:-1]) > gap.value)
+    out = events.iloc[order].reset_index(drop=True)
+    out["session_id"] = np.cumsum(new_session) - 1
+    return out
+
+def session_summary(sessions):
+    if sessions.empty:
+        return {"sessions": 0, "events": 0}
+    g = sessions.groupby("session_id", sort=False)["ts"]
+    lengths = (g.max() - g.min()).dt.total_seconds()
+    sizes = g.size()
+    types = sessions["type"].cat.codes
+    return {
+        "sessions": int(len(sizes)),
+        "events": int(len(sessions)),
+        "users": int(sessions["user_id"].nunique()),
+        "avg_events_per_session": float(sizes.mean()),
+        "median_session_seconds": float(lengths.median()),
+        "avg_session_seconds": float(lengths.mean()),
+        "sessions_with_like": int(sessions.loc[types == _type_code(sessions["type"], "like"), "session_id"].nunique()),
+        "sessions_with_attempt": int(sessions.loc[types == _type_code(sessions["type"], "attempt"), "session_id"].nunique()),
+    }
+
+def funnel_reach(sessions, window=FUNNEL_WINDOW):
+    """
+    For every view, how far along view -> like -> attempt -> rating the same user
+    got on the same recipe within `window`. Returns a DataFrame with one row per
+    view: user_id, recipe_id, ts and a boolean column per later stage.
+    """
+    user = sessions["user_id"].cat.codes.to_numpy().astype(np.int64)
+    recipe = sessions["recipe_id"].cat.codes.to_numpy().astype(np.int64)
+    ts = _epoch_ns(sessions["ts"])
+    # compared as category codes, not as a string per event
+    types = sessions["type"].cat.codes.to_numpy()
+
+    # dense (user, recipe) pair codes; the stable re-sort keeps timestamp order within a pair
+    pair = pd.factorize(user * (recipe.max() + 1 if len(recipe) else 1) + recipe)[0].astype(np.int64)
+    order = np.argsort(pair, kind="stable")
+    pair, ts, types = pair[order], ts[order], types[order]
+    rows = sessions.index.to_numpy()[order]
+
+    # composite (pair, timestamp-rank) key so one searchsorted finds "next event of the pair at or after t"
+    ts_rank = np.unique(ts, return_inverse=True)[1].astype(np.int64).reshape(-1)
+    n_ranks = int(ts_rank.max()) + 1 if len(ts_rank) else 1
+    if len(pair) and int(pair.max()) + 1 > np.iinfo(np.int64).max // n_ranks:
+        raise OverflowError("too many (user, recipe) pairs x distinct timestamps for int64 keys")
+    key = pair * n_ranks + ts_rank
+
+    is_view = types == _type_code(sessions["type"], "view")
+    start_ts = ts[is_view]
+    cur_key = key[is_view]
+    cur_pair = pair[is_view]
+    alive = np.ones(len(start_ts), dtype=bool)
+    reached = {}
+    for stage in FUNNEL_STAGES[1:]:
+        sel = types == _type_code(sessions["type"], stage)
+        t_key, t_pair, t_ts = key[sel], pair[sel], ts[sel]
+        idx = np.searchsorted(t_key, cur_key, side="left")
+        found = idx < len(t_key)
+        idx_c = np.where(found, idx, 0)
+        if len(t_key):
+            found &= (t_pair[idx_c] == cur_pair) & ((t_ts[idx_c] - start_ts) <= window.value)
+        else:
+            found[:] = False
+        alive &= found
+        reached[stage] = alive.copy()
+        # the next stage has to come after this one
+        if len(t_key):
+            cur_key = np.where(alive, t_key[idx_c], cur_key)
+
+    views = sessions.loc[rows[is_view], ["user_id", "recipe_id", "ts"]].reset_index(drop=True)
+    for stage, flags in reached.items():
+        views[f"reached_{stage}"] = flags
+    return views
+
+def _funnel_table(views, by):
+    cols = [f"reached_{s}" for s in FUNNEL_STAGES[1:]]
+    g = views.groupby(by, observed=True)
+    table = g[cols].sum().astype(int)
+    table.insert(0, "views", g.size())
+    table.columns = ["views"] + [f"view_to_{s}" for s in FUNNEL_STAGES[1:]]
+    for s in FUNNEL_STAGES[1:]:
+        table[f"{s}_rate"] = table[f"view_to_{s}"] / table["views"]
+    return table
+
+def funnel_by_recipe(views):
+    return _funnel_table(views, "recipe_id").sort_values("views", ascending=False, kind="stable")
+
+def funnel_by_cohort(views, cohorts):
+    views = views.copy()
+    views["cohort"] = views["user_id"].astype(str).map(cohorts).fillna("unknown")
+    return _funnel_table(views, "cohort").sort_index()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-user view->like->attempt->rating funnels and sessions.")
+    ap.add_argument("--gap-minutes", type=float, default=SESSION_GAP.total_seconds() / 60)
+    ap.add_argument("--window-hours", type=float, default=FUNNEL_WINDOW.total_seconds() / 3600)
+    args = ap.parse_args(argv)
+    metrics.reset()
+
+    with metrics.stage("load_events") as st:
+        events = load_events()
+        cohorts = load_user_cohorts()
+        st.rows_out = len(events)
+    with metrics.stage("sessionize", rows_in=len(events)) as st:
+        sessions = sessionize(events, gap=pd.Timedelta(minutes=args.gap_minutes))
+        summary = session_summary(sessions)
+        summary["session_gap_minutes"] = args.gap_minutes
+        st.rows_out = summary["sessions"]
+    with metrics.stage("funnel", rows_in=len(sessions)) as st:
+        views = funnel_reach(sessions, window=pd.Timedelta(hours=args.window_hours))
+        by_recipe = funnel_by_recipe(views)
+        by_cohort = funnel_by_cohort(views, cohorts)
+        st.rows_out = len(views)
+
+    OUT.mkdir(exist_ok=True)
+    by_recipe.to_csv(OUT / "funnel_by_recipe.csv")
+    by_cohort.to_csv(OUT / "funnel_by_cohort.csv")
+    summary["funnel_window_hours"] = args.window_hours
+    with open(OUT / "sessions_summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print("Sessions:", json.dumps(summary, indent=2))
+    print("\nFunnel by signup cohort:")
+    print(by_cohort.to_string())
+    print("\nFunnel by recipe (top 10 by views):")
+    print(by_recipe.head(10).to_string())
+    print("\nWrote:", OUT / "funnel_by_recipe.csv", OUT / "funnel_by_cohort.csv", OUT / "sessions_summary.json")
+    metrics.print_summary()
+    metrics.write()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+# leaderboard.py
+"""
+Precomputed recipe leaderboards with incremental top-K maintenance.
+
+Per recipe the leaderboard keeps views, likes, attempts and the rating sum and
+count, and from them these metrics:
+
+ - views        : number of views (insight 5)
+ - avg_rating   : mean rating (insight 7)
+ - bayes_rating : Bayesian-smoothed rating (w*m + sum) / (w + count), so one 5-star
+                  rating does not beat a hundred 4.8s; the prior mean m and weight w
+                  are fixed when the leaderboard is built (default m = mean of all
+                  ratings at build time, w = 5) so later updates stay incremental
+ - engagement   : views + 2*likes + 1.5*attempts (insights 6 and 9)
+ - like_rate    : likes / views, 0 without views (insight 8)
+
+Each metric has a board over all recipes plus one per cuisine and one per
+difficulty. A board (TopK) holds its K best recipes in an indexed min-heap and the
+other recipes in a max-heap of candidates, so a new interaction costs O(log K) for
+a recipe already on the board (O(log N) otherwise) per affected board, and scores
+may go down (a low rating) as well as up. Ties rank by recipe_id, as in
+generate_insights.top_n. Reading a board sorts only its K entries.
+
+The whole state is saved as analysis_output/leaderboard.json:
+
+    python leaderboard.py build                          # from normalized_csv/
+    python leaderboard.py add new_interactions.csv       # recipe_id,type,value rows
+    python leaderboard.py top --metric bayes_rating --cuisine Indian -n 5
+"""
+
+import argparse
+import heapq
+import json
+import math
+from pathlib import Path
+import pandas as pd
+from pipeline_metrics import MetricsRecorder
+from table_loader import read_table
+
+BASE = Path("normalized_csv")
+OUT = Path("analysis_output")
+STATE_PATH = OUT / "leaderboard.json"
+FORMAT = "leaderboard/v1"
+DEFAULT_K = 10
+PRIOR_WEIGHT = 5.0
+METRICS = ["views", "avg_rating", "bayes_rating", "engagement", "like_rate"]
+DIMENSIONS = ["cuisine", "difficulty"]
+
+# metrics that change with each interaction type
+AFFECTED = {
+    "view": ["views", "engagement", "like_rate"],
+    "like": ["engagement", "like_rate"],
+    "attempt": ["engagement"],
+    "rating": ["avg_rating", "bayes_rating"],
+}
+
+# per-recipe stats: [views, likes, attempts, rating_sum, rating_count]
+VIEWS, LIKES, ATTEMPTS, RATING_SUM, RATING_COUNT = range(5)
+
+metrics = MetricsRecorder("leaderboard")
+
+def bayesian_rating(rating_sum, rating_count, prior_mean, prior_weight=PRIOR_WEIGHT):
+    return (prior_weight * prior_mean + rating_sum) / (prior_weight + rating_count)
+
+def board_name(metric, dimension=None, value=None):
+    return metric if dimension is None else f"{metric}|{dimension}={value}"
+
+class TopK:
+    """
+    The k highest-scoring keys. Members live in a min-heap (worst member at the
+    root) with a key -> position map, so a member's score can change in O(log k);
+    every other key waits in a max-heap of candidates whose outdated entries are
+    skipped lazily, which is what lets a member drop out when its score falls.
+    """
+    def __init__(self, k=DEFAULT_K):
+        self.k = k
+        self.heap = []     # [(score, key)], min-heap by rank
+        self.pos = {}      # key -> index in heap
+        self.scores = {}   # key -> current score, members and candidates
+        self.cands = []    # [(-score, key)], heapq; entries may be outdated
+
+    def __len__(self):
+        return len(self.scores)
+
+    @staticmethod
+    def _worse(a, b):
+        # lower score ranks lower; on ties the larger key ranks lower
+        return a[0] < b[0] or (a[0] == b[0] and a[1] > b[1])
+
+    def _swap(self, i, j):
+        h = self.heap
+        h[i], h[j] = h[j], h[i]
+        self.pos[h[i][1]] = i
+        self.pos[h[j][1]] = j
+
+    def _sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if not self._worse(self.heap[i], self.heap[parent]):
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        n = len(self.heap)
+        while True:
+            worst = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and self._worse(self.heap[child], self.heap[worst]):
+                    worst = child
+            if worst == i:
+                return
+            self._swap(i, worst)
+            i = worst
+
+    def _push_member(self, entry):
+        self.heap.append(entry)
+        self.pos[entry[1]] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+
+    def _pop_member(self, i=0):
+        last = self.heap.pop()
+        entry = last
+        if i < len(self.heap):
+            entry, self.heap[i] = self.heap[i], last
+            self.pos[last[1]] = i
+            self._sift_up(i)
+            self._sift_down(self.pos[last[1]])
+        del self.pos[entry[1]]
+        return entry
+
+    def _best_candidate(self):
+        while self.cands:
+            neg, key = self.cands[0]
+            if key not in self.pos and self.scores.get(key) == -neg:
+                return (-neg, key)
+            heapq.heappop(self.cands)  # outdated: member now, rescored or removed
+        return None
+
+    def _rebalance(self):
+        while len(self.heap) < self.k:
+            best = self._best_candidate()
+            if best is None:
+                return
+            heapq.heappop(self.cands)
+            self._push_member(best)
+        while self.heap:
+            best = self._best_candidate()
+            if best is None or not self._worse(self.heap[0], best):
+                return
+            heapq.heappop(self.cands)
+            worst = self._pop_member()
+            heapq.heappush(self.cands, (-worst[0], worst[1]))
+            self._push_member(best)
+
+    def _compact(self):
+        # drop outdated candidate entries once they outnumber the live ones
+        if len(self.cands) > 2 * (len(self.scores) - len(self.heap)) + 64:
+            self.cands = [(-s, key) for key, s in self.scores.items() if key not in self.pos]
+            heapq.heapify(self.cands)
+
+    def update(self, key, score):
+        old = self.scores.get(key)
+        self.scores[key] = score
+        i = self.pos.get(key)
+        if i is not None:
+            self.heap[i] = (score, key)
+            self._sift_up(i)
+            self._sift_down(self.pos[key])
+            if score < old:
+                self._rebalance()
+        else:
+            heapq.heappush(self.cands, (-score, key))
+            self._rebalance()
+        self._compact()
+
+    def remove(self, key):
+        if self.scores.pop(key, None) is None:
+            return
+        if key in self.pos:
+            self._pop_member(self.pos[key])
+            self._rebalance()
+        self._compact()
+
+    def top(self, n=None):
+        """[(key, score)] best first; sorts the k members only."""
+        ranked = sorted(self.heap, key=lambda e: (-e[0], e[1]))
+        return [(key, score) for score, key in ranked[:n]]
+
+    @classmethod
+    def from_scores(cls, scores, k=DEFAULT_K):
+        """Bulk build in O(N log k): select the k best, heapify the rest."""
+        board = cls(k)
+        board.scores = dict(scores)
+        best = heapq.nsmallest(k, board.scores.items(), key=lambda kv: (-kv[1], kv[0]))
+        for key, score in best:
+            board._push_member((score, key))
+        board.cands = [(-s, key) for key, s in board.scores.items() if key not in board.pos]
+        heapq.heapify(board.cands)
+        return board
+
+    def to_dict(self):
+        # members in heap order, so loading needs no sift at all
+        return {
+            "k": self.k,
+            "members": [[key, score] for score, key in self.heap],
+            "candidates": [[key, s] for key, s in self.scores.items() if key not in self.pos],
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        board = cls(d["k"])
+        board.heap = [(score, key) for key, score in d["members"]]
+        board.pos = {key: i for i, (_, key) in enumerate(board.heap)}
+        board.scores = {key: score for key, score in d["members"]}
+        board.scores.update((key, s) for key, s in d["candidates"])
+        board.cands = [(-s, key) for key, s in d["candidates"]]
+        heapq.heapify(board.cands)
+        return board
+
+class Leaderboard:
+    """Per-recipe stats plus one TopK per (metric, all / cuisine / difficulty)."""
+    def __init__(self, k=DEFAULT_K, prior_mean=None, prior_weight=PRIOR_WEIGHT):
+        self.k = k
+        self.prior_mean = prior_mean
+        self.prior_weight = prior_weight
+        self.stats = {}   # recipe_id -> [views, likes, attempts, rating_sum, rating_count]
+        self.meta = {}    # recipe_id -> {"cuisine": ..., "difficulty": ...}
+        self.boards = {}  # board_name -> TopK
+
+    def score(self, metric, s):
+        """The recipe's score on `metric`, or None while it has nothing to rank by."""
+        views, likes, attempts, rating_sum, rating_count = s
+        if metric in ("avg_rating", "bayes_rating"):
+            if rating_count == 0:
+                return None
+            if metric == "avg_rating":
+                return rating_sum / rating_count
+            return bayesian_rating(rating_sum, rating_count, self.prior_mean, self.prior_weight)
+        if metric == "views":
+            return float(views) if views else None
+        if views + likes + attempts == 0:
+            return None
+        if metric == "engagement":
+            return views + 2 * likes + 1.5 * attempts
+        return likes / views if views else 0.0
+
+    def _boards_of(self, recipe_id, metric):
+        names = [board_name(metric)]
+        meta = self.meta.get(recipe_id, {})
+        for dim in DIMENSIONS:
+            if dim in meta:
+                names.append(board_name(metric, dim, meta[dim]))
+        return names
+
+    def _board(self, name):
+        board = self.boards.get(name)
+        if board is None:
+            board = self.boards[name] = TopK(self.k)
+        return board
+
+    def _rescore(self, recipe_id, metric_names):
+        s = self.stats.get(recipe_id)
+        if s is None:
+            return
+        for metric in metric_names:
+            score = self.score(metric, s)
+            for name in self._boards_of(recipe_id, metric):
+                if score is None:
+                    if name in self.boards:
+                        self.boards[name].remove(recipe_id)
+                else:
+                    self._board(name).update(recipe_id, score)
+
+    def set_recipe(self, recipe_id, cuisine="", difficulty=""):
+        """Register (or re-file) a recipe under its cuisine and difficulty boards."""
+        recipe_id = str(recipe_id)
+        new = {"cuisine": cuisine, "difficulty": difficulty}
+        old = self.meta.get(recipe_id)
+        if old == new:
+            return
+        if old is not None:
+            for metric in METRICS:
+                for dim in DIMENSIONS:
+                    board = self.boards.get(board_name(metric, dim, old[dim]))
+                    if board is not None:
+                        board.remove(recipe_id)
+        self.meta[recipe_id] = new
+        self._rescore(recipe_id, METRICS)
+
+    def add_interaction(self, recipe_id, itype, value=None):
+        """Apply one interaction; returns False if its type is not ranked."""
+        itype = str(itype).strip().lower()
+        if itype not in AFFECTED:
+            return False
+        if itype == "rating":
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return False
+            if math.isnan(value):
+                return False
+        recipe_id = str(recipe_id)
+        s = self.stats.setdefault(recipe_id, [0, 0, 0, 0.0, 0])
+        if itype == "view":
+            s[VIEWS] += 1
+        elif itype == "like":
+            s[LIKES] += 1
+        elif itype == "attempt":
+            s[ATTEMPTS] += 1
+        else:
+            if self.prior_mean is None:
+                self.prior_mean = value  # first rating of an empty leaderboard
+            s[RATING_SUM] += value
+            s[RATING_COUNT] += 1
+        self._rescore(recipe_id, AFFECTED[itype])
+        return True
+
+    def top(self, metric, cuisine=None, difficulty=None, n=None):
+        """[(recipe_id, score)] best first, from the board for one cuisine OR one difficulty (or all)."""
+        if metric not in METRICS:
+            raise KeyError(f"unknown metric {metric!r}; one of {METRICS}")
+        if cuisine is not None and difficulty is not None:
+            raise ValueError("boards are per cuisine or per difficulty, not both")
+        if cuisine is not None:
+            name = board_name(metric, "cuisine", cuisine)
+        elif difficulty is not None:
+            name = board_name(metric, "difficulty", str(difficulty).lower())
+        else:
+            name = board_name(metric)
+        board = self.boards.get(name)
+        return board.top(n) if board is not None else []
+
+    @classmethod
+    def from_tables(cls, df_rec, df_int, k=DEFAULT_K, prior_mean=None, prior_weight=PRIOR_WEIGHT):
+        """Bulk build from recipes (recipe_id, cuisine, difficulty) and interactions (recipe_id, type, value)."""
+        df_int = df_int[df_int["recipe_id"].notna() & df_int["type"].isin(list(AFFECTED))]
+        counts = pd.crosstab(df_int["recipe_id"].astype(str), df_int["type"].astype(str))
+        ratings = df_int[df_int["type"] == "rating"]
+        rating_agg = ratings.groupby(ratings["recipe_id"].astype(str))["value"].agg(["sum", "count"])
+        stats = pd.DataFrame(index=counts.index.union(rating_agg.index))
+        for col in ("view", "like", "attempt"):
+            stats[col] = counts[col] if col in counts else 0
+        stats["rating_sum"] = rating_agg["sum"]
+        stats["rating_count"] = rating_agg["count"]
+        stats = stats.fillna(0)
+        if prior_mean is None:
+            n_ratings = stats["rating_count"].sum()
+            prior_mean = float(stats["rating_sum"].sum() / n_ratings) if n_ratings else None
+
+        lb = cls(k, prior_mean, prior_weight)
+        lb.stats = {rid: [int(v), int(l), int(a), float(rs), int(rc)]
+                    for rid, v, l, a, rs, rc in stats.itertuples()}
+        rec = df_rec.assign(recipe_id=df_rec["recipe_id"].astype(str))
+        for col in DIMENSIONS:
+            rec[col] = rec[col].astype(object).where(rec[col].notna(), "").astype(str)
+        lb.meta = {rid: {"cuisine": c, "difficulty": d}
+                   for rid, c, d in rec[["recipe_id", "cuisine", "difficulty"]].itertuples(index=False)}
+
+        scores = {}
+        for rid, s in lb.stats.items():
+            for metric in METRICS:
+                score = lb.score(metric, s)
+                if score is not None:
+                    for name in lb._boards_of(rid, metric):
+                        scores.setdefault(name, {})[rid] = score
+        lb.boards = {name: TopK.from_scores(sc, k) for name, sc in scores.items()}
+        return lb
+
+    def to_dict(self):
+        return {
+            "format": FORMAT,
+            "k": self.k,
+            "prior_mean": self.prior_mean,
+            "prior_weight": self.prior_weight,
+            "stats": self.stats,
+            "meta": self.meta,
+            "boards": {name: board.to_dict() for name, board in self.boards.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get("format") != FORMAT:
+            raise ValueError(f"not a {FORMAT} file")
+        lb = cls(d["k"], d["prior_mean"], d["prior_weight"])
+        lb.stats = d["stats"]
+        lb.meta = d["meta"]
+        lb.boards = {name: TopK.from_dict(b) for name, b in d["boards"].items()}
+        return lb
+
+    def save(self, path=STATE_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(f"{path} not found. Run leaderboard.py build first.")
+        return cls.from_dict(json.load(open(path, "r", encoding="utf-8")))
+
+def build(base=BASE, k=DEFAULT_K, prior_mean=None, prior_weight=PRIOR_WEIGHT):
+    with metrics.stage("load_csv") as st:
+        df_rec = read_table("recipes", ["recipe_id", "cuisine", "difficulty"], base=base)
+        df_int = read_table("interactions", ["recipe_id", "type", "value"], base=base)
+        st.rows_out = len(df_rec) + len(df_int)
+    with metrics.stage("build_boards", rows_in=len(df_int)) as st:
+        lb = Leaderboard.from_tables(df_rec, df_int, k, prior_mean, prior_weight)
+        st.rows_out = len(lb.boards)
+        st.extra["recipes"] = len(lb.stats)
+    return lb
+
+def apply_csv(lb, path, recipes=None):
+    """Apply the interactions of a CSV (recipe_id, type, value) to lb; returns (applied, skipped)."""
+    if recipes is not None:
+        df_rec = pd.read_csv(recipes, dtype=str, usecols=lambda c: c in ("recipe_id", "cuisine", "difficulty"))
+        df_rec = df_rec.fillna("")
+        for row in df_rec.itertuples(index=False):
+            lb.set_recipe(row.recipe_id, row.cuisine if "cuisine" in df_rec else "",
+                          row.difficulty.lower() if "difficulty" in df_rec else "")
+    df = pd.read_csv(path, dtype={"recipe_id": str, "type": str},
+                     usecols=lambda c: c in ("recipe_id", "type", "value"))
+    if "value" not in df:
+        df["value"] = None
+    applied = 0
+    for rid, itype, value in df[["recipe_id", "type", "value"]].itertuples(index=False):
+        if not pd.isna(rid):
+            applied += lb.add_interaction(rid, itype, value)
+    return applied, len(df) - applied
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Recipe leaderboards (rating, Bayesian rating, engagement) with incremental top-K.")
+    ap.add_argument("--state", default=str(STATE_PATH), help="leaderboard file")
+    sub = ap.add_subparsers(dest="action", required=True)
+    b = sub.add_parser("build", help="build from normalized_csv/")
+    b.add_argument("-k", type=int, default=DEFAULT_K, help="entries kept per board")
+    b.add_argument("--prior-mean", type=float, help="Bayesian prior mean (default: mean of all ratings)")
+    b.add_argument("--prior-weight", type=float, default=PRIOR_WEIGHT, help="Bayesian prior weight, in ratings")
+    a = sub.add_parser("add", help="apply new interactions from a CSV (recipe_id,type,value)")
+    a.add_argument("csv")
+    a.add_argument("--recipes", help="CSV of new/changed recipes (recipe_id,cuisine,difficulty)")
+    t = sub.add_parser("top", help="print a board")
+    t.add_argument("--metric", default="bayes_rating", choices=METRICS)
+    group = t.add_mutually_exclusive_group()
+    group.add_argument("--cuisine")
+    group.add_argument("--difficulty")
+    t.add_argument("-n", type=int, help="entries to print (default: all kept)")
+    args = ap.parse_args(argv)
+    metrics.reset()
+
+    if args.action == "build":
+        if args.k < 1:
+            ap.error("-k must be >= 1")
+        try:
+            lb = build(k=args.k, prior_mean=args.prior_mean, prior_weight=args.prior_weight)
+        except FileNotFoundError as e:
+            raise SystemExit(str(e))
+        with metrics.stage("save"):
+            lb.save(args.state)
+        print(f"Built {len(lb.boards)} boards over {len(lb.stats)} recipes "
+              f"(k={lb.k}, prior {lb.prior_mean} x {lb.prior_weight}) -> {args.state}")
+    elif args.action == "add":
+        try:
+            with metrics.stage("load"):
+                lb = Leaderboard.load(args.state)
+        except FileNotFoundError as e:
+            raise SystemExit(str(e))
+        with metrics.stage("apply") as st:
+            applied, skipped = apply_csv(lb, args.csv, args.recipes)
+            st.rows_out = applied
+        with metrics.stage("save"):
+            lb.save(args.state)
+        print(f"Applied {applied} interactions ({skipped} skipped) -> {args.state}")
+    else:
+        try:
+            lb = Leaderboard.load(args.state)
+        except FileNotFoundError as e:
+            raise SystemExit(str(e))
+        rows = lb.top(args.metric, args.cuisine, args.difficulty, args.n)
+        where = f"cuisine={args.cuisine}" if args.cuisine else f"difficulty={args.difficulty}" if args.difficulty else "all"
+        print(f"{args.metric} ({where}):")
+        for rank, (rid, score) in enumerate(rows, start=1):
+            s = lb.stats[rid]
+            print(f"{rank:>3}. {rid}  {score:.4f}  (views {s[VIEWS]}, likes {s[LIKES]}, "
+                  f"attempts {s[ATTEMPTS]}, ratings {s[RATING_COUNT]})")
+        return
+    metrics.print_summary()
+    metrics.write()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+# load_firestore.py
+"""
+Reverse ETL: bulk-load normalized_csv/ back into Firestore (restore / migrate).
+
+ - recipes: nested documents are rebuilt by sorting recipes, ingredients and steps
+   by recipe_id once and merging the three sorted streams (no per-recipe filtering),
+   written to recipes/<recipe_id>
+ - interactions: written to interactions/<event id>, where the event id hashes the
+   interaction_id together with the content fingerprint (the dedup key from
+   dedup.interaction_keys), so a reload overwrites instead of duplicating and rows
+   that only share an interaction_id are all kept
+
+Writes go out in batches (Firestore allows 500 writes per batch), up to
+--concurrency batches in flight, throttled by a token bucket (--rate documents/s;
+Firestore recommends starting new collections at ~500/s). Retried batches are
+harmless because every document has a fixed id.
+
+Documents are generated from the sorted tables as they are written, not collected
+first. Rows whose document id is already taken (a reused recipe_id, or an
+interaction identical in id and content) would overwrite each other, so only the
+first is written and the others are counted and reported. --verify also checks
+that every interaction row is accounted for (restored or an exact duplicate).
+
+Progress is checkpointed per collection as the number of documents whose batches
+have all committed (the contiguous prefix of the deterministic document order), so
+an interrupted load resumes where it stopped. The checkpoint is tied to the size
+and modification time of the input CSVs; after a new transform it is refused:
+
+    python load_firestore.py                       # FIRESTORE_EMULATOR_HOST=... for the emulator
+    python load_firestore.py --verify              # read every document back and compare
+    python load_firestore.py --dry-run             # in-memory fake Firestore, then verify
+    python load_firestore.py --restart             # ignore the checkpoint
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from dedup import interaction_fingerprint
+from pipeline_metrics import MetricsRecorder
+from table_loader import read_table
+
+BASE = Path("normalized_csv")
+CHECKPOINT_PATH = Path("load_checkpoint.json")
+COLLECTIONS = ["recipes", "interactions"]
+MAX_BATCH = 500
+DEFAULT_RATE = 500.0
+DEFAULT_CONCURRENCY = 4
+MAX_RETRIES = 5
+RETRY_BASE_SECONDS = 0.5
+
+metrics = MetricsRecorder("load")
+
+# Building documents
+
+def _int_or_none(x):
+    try:
+        return int(float(x)) if x != "" else None
+    except ValueError:
+        return None
+
+def _number_or_none(x):
+    try:
+        v = float(x) if x != "" else None
+    except ValueError:
+        return None
+    return int(v) if v is not None and v.is_integer() else v
+
+def _order_key(value):
+    # missing / bad numbers sort after the numbered ones; the stable sort keeps file order among them
+    n = _int_or_none(value)
+    return (0, n) if n is not None else (1, 0)
+
+def recipe_doc(r, ingredients, steps):
+    doc = {
+        "recipe_id": r["recipe_id"],
+        "title": r["title"],
+        "description": r["description"],
+        "author_id": r["author_id"],
+        "servings": _int_or_none(r["servings"]),
+        "prep_time_minutes": _int_or_none(r["prep_time_minutes"]),
+        "cook_time_minutes": _int_or_none(r["cook_time_minutes"]),
+        "difficulty": r["difficulty"],
+        "cuisine": r["cuisine"],
+        "tags": r["tags"].split("|") if r["tags"] else [],
+        "ingredients": [{"name": i["name"], "quantity": i["quantity"], "order": _int_or_none(i["order"])}
+                        for i in ingredients],
+        "steps": [{"step_number": _int_or_none(s["step_number"]), "description": s["description"]}
+                  for s in steps],
+    }
+    for field in ("created_at", "updated_at"):
+        if r[field]:
+            doc[field] = r[field]
+    return doc
+
+def _take_group(rows, pos, recipe_id):
+    """Rows [pos, end) of a recipe_id-sorted list that belong to recipe_id, plus the
+    orphans (recipe_id sorting before it) skipped on the way."""
+    orphans = 0
+    while pos < len(rows) and rows[pos]["recipe_id"] < recipe_id:
+        pos += 1
+        orphans += 1
+    end = pos
+    while end < len(rows) and rows[end]["recipe_id"] == recipe_id:
+        end += 1
+    return rows[pos:end], end, orphans
+
+def iter_recipe_docs(recipes, ingredients, steps, stats=None):
+    """
+    Sort-merge the three tables (lists of row dicts) into (recipe_id, document) pairs in
+    recipe_id order: one O(n log n) sort per table, then a single linear pass.
+    """
+    recipes = sorted(recipes, key=lambda r: r["recipe_id"])
+    ingredients = sorted(ingredients, key=lambda i: (i["recipe_id"], _order_key(i["order"])))
+    steps = sorted(steps, key=lambda s: (s["recipe_id"], _order_key(s["step_number"])))
+    stats = stats if stats is not None else {}
+    stats.update({"recipes": 0, "orphan_ingredients": 0, "orphan_steps": 0, "duplicate_recipes": 0})
+    i_pos = s_pos = 0
+    previous = None
+    for r in recipes:
+        rid = r["recipe_id"]
+        if not rid:
+            continue
+        if rid == previous:
+            stats["duplicate_recipes"] += 1  # children already went to the first one
+            continue
+        previous = rid
+        ings, i_pos, orphans = _take_group(ingredients, i_pos, rid)
+        stats["orphan_ingredients"] += orphans
+        stps, s_pos, orphans = _take_group(steps, s_pos, rid)
+        stats["orphan_steps"] += orphans
+        stats["recipes"] += 1
+        yield rid, recipe_doc(r, ings, stps)
+    stats["orphan_ingredients"] += len(ingredients) - i_pos
+    stats["orphan_steps"] += len(steps) - s_pos
+
+def interaction_doc_id(it):
+    """Document id of one interaction row: a hash of its dedup key (interaction_id + content fingerprint)."""
+    fp = interaction_fingerprint(it["user_id"], it["recipe_id"], it["type"], it["timestamp"])
+    key = f"{it['interaction_id']}\x1f{fp}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+def iter_interaction_docs(interactions, stats=None):
+    """
+    (event id, document) pairs in event id order. Rows sharing an interaction_id
+    but not their content get their own documents; exact duplicates are counted,
+    not written.
+    """
+    stats = stats if stats is not None else {}
+    stats.update({"rows": len(interactions), "interactions": 0, "duplicate_interactions": 0})
+    previous = None
+    for doc_id, it in sorted(((interaction_doc_id(it), it) for it in interactions), key=lambda p: p[0]):
+        if doc_id == previous:
+            stats["duplicate_interactions"] += 1  # same id and content; the first row (file order) is kept
+            continue
+        previous = doc_id
+        stats["interactions"] += 1
+        yield doc_id, {
+            "interaction_id": it["interaction_id"] or None,
+            "recipe_id": it["recipe_id"] or None,
+            "user_id": it["user_id"] or None,
+            "type": it["type"],
+            "value": _number_or_none(it["value"]),
+            "timestamp": it["timestamp"],
+        }
+
+def build_docs(collection, base=BASE, stats=None):
+    """
+    Iterator of (doc_id, document) pairs for a collection, in a deterministic order.
+    The tables are read now; documents are built as the iterator is consumed, and
+    `stats` is complete once it is exhausted.
+    """
+    if collection == "recipes":
+        tables = [read_table(t, base=base, raw=True).to_dict(orient="records")
+                  for t in ("recipes", "ingredients", "steps")]
+        return iter_recipe_docs(*tables, stats=stats)
+    if collection == "interactions":
+        rows = read_table("interactions", base=base, raw=True).to_dict(orient="records")
+        return iter_interaction_docs(rows, stats=stats)
+    raise KeyError(f"no loader for collection {collection!r}")
+
+# Writing
+
+class TokenBucket:
+    """Allows `rate` tokens per second with bursts up to `capacity`; acquire() blocks."""
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1):
+        n = min(n, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait_s = (n - self.tokens) / self.rate
+            time.sleep(wait_s)
+
+class Checkpoint:
+    """{collection: documents committed} in a JSON file, tied to the input it was made from."""
+    def __init__(self, path, source):
+        self.path = Path(path) if path else None
+        self.source = source
+        self.done = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.path is None or not self.path.exists():
+            return self
+        state = json.load(open(self.path, "r", encoding="utf-8"))
+        if state.get("source") != self.source:
+            raise SystemExit(f"{self.path} was written for different input files; use --restart")
+        self.done = state.get("done", {})
+        return self
+
+    def save(self, collection, n_done):
+        with self.lock:
+            self.done[collection] = n_done
+            if self.path is None:
+                return
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"source": self.source, "done": self.done}, f, indent=2)
+            tmp.replace(self.path)
+
+def source_signature(base=BASE):
+    """Size and modification time of each input CSV (a new transform changes the mtime)."""
+    return {p.name: [p.stat().st_size, p.stat().st_mtime_ns] for p in sorted(Path(base).glob("*.csv"))}
+
+def commit_batch(db, collection, items):
+    for attempt in range(MAX_RETRIES):
+        try:
+            batch = db.batch()
+            coll = db.collection(collection)
+            for doc_id, doc in items:
+                batch.set(coll.document(doc_id), doc)
+            batch.commit()
+            return len(items)
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            delay = RETRY_BASE_SECONDS * 2 ** attempt
+            print(f"  batch of {len(items)} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def write_docs(db, collection, docs, checkpoint, batch_size=MAX_BATCH, concurrency=DEFAULT_CONCURRENCY,
+               bucket=None):
+    """
+    Write (doc_id, doc) pairs from any iterable, skipping the already checkpointed
+    prefix (by count, so the order must be deterministic). Batches commit
+    concurrently; the checkpoint only advances over batches with no unfinished batch
+    before them. Returns the number of documents written in this run.
+    """
+    start = checkpoint.done.get(collection, 0)
+    batch_size = min(batch_size, MAX_BATCH)
+    pending = {}
+    finished = {}
+    next_batch = 0
+    committed = 0
+
+    def settle(done_futures):
+        nonlocal next_batch, committed
+        for fut in done_futures:
+            index = pending.pop(fut)
+            finished[index] = fut.result()  # re-raises a batch that failed all retries
+        while next_batch in finished:
+            committed += finished.pop(next_batch)
+            next_batch += 1
+        checkpoint.save(collection, start + committed)
+
+    it = itertools.islice(iter(docs), start, None)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for index in itertools.count():
+            items = list(itertools.islice(it, batch_size))
+            if not items:
+                break
+            if bucket is not None:
+                bucket.acquire(len(items))
+            pending[pool.submit(commit_batch, db, collection, items)] = index
+            if len(pending) >= concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                settle(done)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            settle(done)
+    return committed
+
+def verify_docs(db, collection, docs, chunk=100):
+    """
+    Reads (doc_id, doc) pairs back; returns (documents checked, doc_ids whose stored
+    document is missing or differs). The ids must be unique (build_docs skips repeated ones).
+    """
+    coll = db.collection(collection)
+    it = iter(docs)
+    checked = 0
+    bad = []
+    while True:
+        part = dict(itertools.islice(it, chunk))
+        if not part:
+            return checked, bad
+        checked += len(part)
+        for snap in db.get_all([coll.document(doc_id) for doc_id in part]):
+            if not snap.exists or snap.to_dict() != part.pop(snap.id):
+                bad.append(snap.id)
+        bad.extend(part)  # ids that did not come back at all
+
+# Local fake (for --dry-run)
+
+class _Snapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return json.loads(json.dumps(self._data)) if self._data is not None else None
+
+class _DocRef:
+    def __init__(self, store, collection, doc_id):
+        self.store, self.collection, self.id = store, collection, doc_id
+
+    def set(self, data):
+        with self.store.lock:
+            self.store.data.setdefault(self.collection, {})[self.id] = json.loads(json.dumps(data))
+
+    def get(self):
+        return _Snapshot(self.id, self.store.data.get(self.collection, {}).get(self.id))
+
+class _Collection:
+    def __init__(self, store, name):
+        self.store, self.name = store, name
+
+    def document(self, doc_id):
+        return _DocRef(self.store, self.name, doc_id)
+
+    def stream(self):
+        docs = self.store.data.get(self.name, {})
+        return (_Snapshot(k, docs[k]) for k in sorted(docs))
+
+class _Batch:
+    def __init__(self):
+        self.writes = []
+
+    def set(self, ref, data):
+        self.writes.append((ref, data))
+
+    def commit(self):
+        if len(self.writes) > MAX_BATCH:
+            raise ValueError(f"batch of {len(self.writes)} writes exceeds {MAX_BATCH}")
+        for ref, data in self.writes:
+            ref.set(data)
+
+class MemoryFirestore:
+    """The small part of the Firestore client API the loader uses, kept in memory."""
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return _Collection(self, name)
+
+    def batch(self):
+        return _Batch()
+
+    def get_all(self, refs):
+        return [ref.get() for ref in refs]
+
+# CLI
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Bulk-load normalized_csv/ back into Firestore.")
+    ap.add_argument("--collections", nargs="+", default=COLLECTIONS, choices=COLLECTIONS)
+    ap.add_argument("--batch-size", type=int, default=MAX_BATCH, help=f"writes per batch (max {MAX_BATCH})")
+    ap.add_argument("--rate", type=float, default=DEFAULT_RATE, help="max documents per second (0 = unlimited)")
+    ap.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="batches in flight")
+    ap.add_argument("--checkpoint", default=str(CHECKPOINT_PATH))
+    ap.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    ap.add_argument("--verify", action="store_true", help="read all documents back and compare")
+    ap.add_argument("--dry-run", action="store_true", help="load into an in-memory fake instead (implies --verify)")
+    args = ap.parse_args(argv)
+    if args.batch_size < 1 or args.concurrency < 1:
+        ap.error("--batch-size and --concurrency must be >= 1")
+    metrics.reset()
+
+    if args.dry_run:
+        db = MemoryFirestore()
+        checkpoint = Checkpoint(None, source_signature())
+    else:
+        from firestore_client import get_db
+        db = get_db()
+        checkpoint = Checkpoint(args.checkpoint, source_signature())
+        if not args.restart:
+            checkpoint.load()
+    bucket = TokenBucket(args.rate, capacity=max(args.rate, args.batch_size)) if args.rate > 0 else None
+
+    failed = False
+    for coll in args.collections:
+        with metrics.stage(coll) as st:
+            with metrics.stage("read_tables"):
+                stats = {}
+                docs = build_docs(coll, stats=stats)
+            skipped = checkpoint.done.get(coll, 0)
+            if skipped:
+                print(f"{coll}: resuming after {skipped} documents")
+            with metrics.stage("write") as sub:
+                sub.rows_out = write_docs(db, coll, docs, checkpoint, args.batch_size, args.concurrency, bucket)
+                sub.extra.update(stats)
+            st.rows_out = sub.rows_out
+            print(f"{coll}: wrote {sub.rows_out} documents ({stats})")
+            duplicates = stats.get("duplicate_recipes", 0) + stats.get("duplicate_interactions", 0)
+            if duplicates:
+                print(f"{coll}: {duplicates} rows duplicate a document already written and were skipped")
+            if args.verify or args.dry_run:
+                with metrics.stage("verify") as sub:
+                    checked, bad = verify_docs(db, coll, build_docs(coll))
+                    sub.rows_in = checked
+                    sub.rows_out = checked - len(bad)
+                print(f"{coll}: verified {checked - len(bad)}/{checked} unique ids"
+                      + (f", mismatched: {bad[:10]}" if bad else ""))
+                failed |= bool(bad)
+                if "rows" in stats:
+                    # every table row is either a restored document or an exact duplicate of one
+                    restored = checked - len(bad) + stats["duplicate_interactions"]
+                    print(f"{coll}: restored {restored}/{stats['rows']} table rows")
+                    failed |= restored != stats["rows"]
+    metrics.print_summary()
+    metrics.write()
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# pipeline_metrics.py
+"""
+Shared stage instrumentation for the export / transform / validate / insights scripts.
+
+Usage:
+    recorder = MetricsRecorder("transform")
+    with recorder.stage("normalize_recipes", rows_in=len(raw)) as st:
+        ...
+        st.rows_out = len(df)
+    recorder.write()
+
+Each stage records wall time, CPU time, rows in/out, rows/sec and its peak resident
+memory (Linux: the VmHWM high-water mark is reset through /proc/self/clear_refs when
+a stage starts and read when it ends; None where that is not possible). The job's
+overall peak RSS is written once per job.
+Stages can be nested (sub-steps are named "<parent>.<child>").
+Writes:
+ - metrics_output/<job>_metrics.json  (full records)
+ - metrics_output/<job>.prom          (Prometheus textfile-collector format)
+
+Environment switches (all opt-in):
+ - RECIPELAB_TRACEMALLOC=1  track Python heap peaks per stage with tracemalloc (slower)
+ - RECIPELAB_PROFILE=1      run functions wrapped with @profiled under cProfile and
+                            dump metrics_output/profiles/<name>.prof (open with pstats/snakeviz)
+"""
+
+import functools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+METRICS_DIR = Path("metrics_output")
+PROFILE_DIR = METRICS_DIR / "profiles"
+
+
+def _env_flag(name):
+    return os.environ.get(name, "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def rss_hwm_bytes():
+    """Resident-memory high-water mark (VmHWM) since the last reset (None off Linux)."""
+    try:
+        with open("/proc/self/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def reset_rss_hwm():
+    """Reset VmHWM to the current RSS; False where /proc/self/clear_refs is not writable."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (None if unavailable); reset along with VmHWM."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Stage:
+    """Mutable handle yielded by MetricsRecorder.stage(); set rows_in/rows_out inside the block."""
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.extra = {}
+        self._child_heap_peak = 0
+        self._child_rss_peak = 0
+
+
+class MetricsRecorder:
+    def __init__(self, job, trace_memory=None):
+        self.job = job
+        self.records = []
+        self._stack = []
+        self._rss_peak = 0  # highest VmHWM seen before any reset
+        self.trace_memory = _env_flag("RECIPELAB_TRACEMALLOC") if trace_memory is None else trace_memory
+
+    def reset(self):
+        """Drop recorded stages (call at the start of each run when reused in-process)."""
+        self.records = []
+        self._stack = []
+        self._rss_peak = 0
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        full_name = f"{self._stack[-1].name}.{name}" if self._stack else name
+        st = Stage(full_name, rows_in)
+
+        tracemalloc = None
+        if self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # remember what the enclosing stage had seen before we reset the peak
+            if self._stack:
+                parent = self._stack[-1]
+                parent._child_heap_peak = max(parent._child_heap_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        # same for resident memory: fold the high-water mark so far into the enclosing
+        # stage (and the job) before resetting it
+        hwm = rss_hwm_bytes()
+        if hwm is not None:
+            self._rss_peak = max(self._rss_peak, hwm)
+            if self._stack:
+                parent = self._stack[-1]
+                parent._child_rss_peak = max(parent._child_rss_peak, hwm)
+        rss_tracked = hwm is not None and reset_rss_hwm()
+
+        self._stack.append(st)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield st
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._stack.pop()
+
+            heap_peak = None
+            if tracemalloc is not None:
+                heap_peak = max(st._child_heap_peak, tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent._child_heap_peak = max(parent._child_heap_peak, heap_peak)
+
+            rss_peak = None
+            if rss_tracked:
+                rss_peak = max(st._child_rss_peak, rss_hwm_bytes() or 0)
+                self._rss_peak = max(self._rss_peak, rss_peak)
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent._child_rss_peak = max(parent._child_rss_peak, rss_peak)
+
+            rows = st.rows_out if st.rows_out is not None else st.rows_in
+            record = {
+                "job": self.job,
+                "stage": full_name,
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "rows_in": st.rows_in,
+                "rows_out": st.rows_out,
+                "rows_per_second": (rows / wall) if rows is not None and wall > 0 else None,
+                "heap_peak_bytes": heap_peak,
+                "rss_peak_bytes": rss_peak,
+            }
+            record.update(st.extra)
+            self.records.append(record)
+
+    def add_stage(self, name, wall_seconds, cpu_seconds=None, rows_in=None, rows_out=None):
+        """
+        Record a sub-step that was timed elsewhere (e.g. accumulated inside a decode
+        loop or summed over worker processes), nested under the current stage.
+        CPU time and memory are only known to the caller, so they default to None.
+        """
+        full_name = f"{self._stack[-1].name}.{name}" if self._stack else name
+        rows = rows_out if rows_out is not None else rows_in
+        self.records.append({
+            "job": self.job,
+            "stage": full_name,
+            "wall_seconds": wall_seconds,
+            "cpu_seconds": cpu_seconds,
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "rows_per_second": (rows / wall_seconds) if rows is not None and wall_seconds > 0 else None,
+            "heap_peak_bytes": None,
+            "rss_peak_bytes": None,
+        })
+
+    def job_rss_peak_bytes(self):
+        """Peak RSS of the whole job (stage resets of VmHWM also reset ru_maxrss)."""
+        peaks = [p for p in (self._rss_peak, rss_hwm_bytes(), peak_rss_bytes()) if p]
+        return max(peaks) if peaks else None
+
+    def to_prometheus(self):
+        """Render records in the Prometheus text exposition format (all gauges)."""
+        metrics = [
+            ("wall_seconds", "Wall-clock time spent in the stage."),
+            ("cpu_seconds", "Process CPU time spent in the stage."),
+            ("rows_in", "Rows entering the stage."),
+            ("rows_out", "Rows leaving the stage."),
+            ("rows_per_second", "Throughput of the stage."),
+            ("heap_peak_bytes", "Peak traced Python heap during the stage (tracemalloc)."),
+            ("rss_peak_bytes", "Peak resident memory (RSS) during the stage."),
+        ]
+        lines = []
+        for key, help_text in metrics:
+            name = f"recipelab_stage_{key}"
+            samples = [r for r in self.records if r.get(key) is not None]
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for r in samples:
+                labels = f'job="{_escape_label(r["job"])}",stage="{_escape_label(r["stage"])}"'
+                lines.append(f"{name}{{{labels}}} {float(r[key]):.6g}")
+        peak = self.job_rss_peak_bytes()
+        if peak is not None:
+            name = "recipelab_job_rss_peak_bytes"
+            lines.append(f"# HELP {name} Peak resident memory of the process so far.")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f'{name}{{job="{_escape_label(self.job)}"}} {float(peak):.6g}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, out_dir=None):
+        out_dir = Path(out_dir) if out_dir is not None else METRICS_DIR
+        out_dir.mkdir(parents=True, exist_ok=True)
+        json_path = out_dir / f"{self.job}_metrics.json"
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"job": self.job, "rss_peak_bytes": self.job_rss_peak_bytes(), "stages": self.records}, f, indent=2)
+        # textfile collectors may read at any time, so replace the .prom file atomically
+        prom_path = out_dir / f"{self.job}.prom"
+        tmp_path = prom_path.with_suffix(".prom.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, prom_path)
+        return json_path, prom_path
+
+    def print_summary(self):
+        print(f"\nStage metrics ({self.job}):")
+        for r in self.records:
+            rows = r["rows_out"] if r["rows_out"] is not None else r["rows_in"]
+            rows_txt = f"{rows} rows" if rows is not None else "-"
+            cpu_txt = f"{r['cpu_seconds']:.4f}s" if r["cpu_seconds"] is not None else "-"
+            print(f"  {r['stage']:<40} wall={r['wall_seconds']:.4f}s cpu={cpu_txt} {rows_txt}")
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def profiled(name=None):
+    """
+    Decorator for hot functions. A no-op unless RECIPELAB_PROFILE is set, in which case
+    each call runs under cProfile and the stats are dumped to metrics_output/profiles/.
+    Sampling profilers such as py-spy attach from outside the process and need no hook;
+    the wrapper keeps the original function name so their flame graphs stay readable.
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _env_flag("RECIPELAB_PROFILE"):
+                return func(*args, **kwargs)
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(func, *args, **kwargs)
+            finally:
+                PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(str(PROFILE_DIR / f"{label}.prof"))
+        return wrapper
+    return decorator
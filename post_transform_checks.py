@@ -1,31 +1,55 @@
 # post_transform_checks.py
-import pandas as pd
+import argparse
 from pathlib import Path
+from table_loader import read_table
 
 P = Path("normalized_csv")
-recipes = pd.read_csv(P / "recipes.csv")
-ingredients = pd.read_csv(P / "ingredients.csv")
-steps = pd.read_csv(P / "steps.csv")
-inter = pd.read_csv(P / "interactions.csv")
-
-print("Counts:")
-print(" recipes:", len(recipes))
-print(" ingredients:", len(ingredients))
-print(" steps:", len(steps))
-print(" interactions:", len(inter))
-
-# Check recipes with zero ingredients
-r_with_no_ing = set(recipes['recipe_id']) - set(ingredients['recipe_id'])
-print("Recipes with ZERO ingredients:", len(r_with_no_ing), list(r_with_no_ing)[:5])
-
-# Check recipes with zero steps
-r_with_no_steps = set(recipes['recipe_id']) - set(steps['recipe_id'])
-print("Recipes with ZERO steps:", len(r_with_no_steps), list(r_with_no_steps)[:5])
-
-# Any interactions with missing timestamps
-missing_ts = inter['timestamp'].isnull().sum() + (inter['timestamp'] == "").sum()
-print("Interactions with missing/blank timestamp:", missing_ts)
-
-# Ingredient name uniqueness sample
-print("Top ingredients (sample):")
-print(ingredients['name'].value_counts().head(10))
+
+def check_sql(db_path):
+    import sql_store
+    conn, _ = sql_store.open_store(db_path)
+    print("Counts:")
+    for table, n in sql_store.table_counts(conn).items():
+        print(f" {table}:", n)
+    for name, ids in sql_store.run_checks(conn).items():
+        print(f"{name}:", len(ids), ids[:5])
+    print("Top ingredients (sample):")
+    for name, n in list(conn.execute(sql_store.INSIGHT_QUERIES["most_common_ingredients"]).fetchall())[:10]:
+        print(f" {name}: {n}")
+    conn.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Sanity checks on normalized_csv/ after the transform.")
+    ap.add_argument("--db", help="run the checks as SQL inside this SQLite/DuckDB store instead")
+    args = ap.parse_args(argv)
+    if args.db:
+        return check_sql(args.db)
+    recipes = read_table("recipes", ["recipe_id"], base=P)
+    ingredients = read_table("ingredients", ["recipe_id", "name"], base=P)
+    steps = read_table("steps", ["recipe_id"], base=P)
+    inter = read_table("interactions", ["timestamp"], base=P, raw=True)
+
+    print("Counts:")
+    print(" recipes:", len(recipes))
+    print(" ingredients:", len(ingredients))
+    print(" steps:", len(steps))
+    print(" interactions:", len(inter))
+
+    # Check recipes with zero ingredients
+    r_with_no_ing = set(recipes['recipe_id']) - set(ingredients['recipe_id'])
+    print("Recipes with ZERO ingredients:", len(r_with_no_ing), list(r_with_no_ing)[:5])
+
+    # Check recipes with zero steps
+    r_with_no_steps = set(recipes['recipe_id']) - set(steps['recipe_id'])
+    print("Recipes with ZERO steps:", len(r_with_no_steps), list(r_with_no_steps)[:5])
+
+    # Any interactions with missing timestamps
+    missing_ts = inter['timestamp'].isnull().sum() + (inter['timestamp'] == "").sum()
+    print("Interactions with missing/blank timestamp:", missing_ts)
+
+    # Ingredient name uniqueness sample
+    print("Top ingredients (sample):")
+    print(ingredients['name'].value_counts().head(10))
+
+if __name__ == "__main__":
+    main()
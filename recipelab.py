@@ -0,0 +1,93 @@
+# recipelab.py
+"""
+Single entry point for the recipeLab pipeline.
+
+    python recipelab.py <command> [options]
+    python recipelab.py transform --help
+
+Each command's module is imported only when that command runs, so `--help` and
+local-only commands do not load firebase_admin, and pandas is only loaded by the
+commands that need it. Commands run in-process through the modules' main(argv)
+functions, and `pipeline` chains several of them without starting new interpreters.
+The Firestore client is created once, on first use (see firestore_client.py).
+"""
+
+import argparse
+import importlib
+import sys
+
+# command -> (module, help)
+COMMANDS = {
+    "export": ("export_firestore", "export Firestore collections to exported_json/"),
+    "verify-export": ("export_shards", "check exported_json/ shards against their manifests"),
+    "seed": (None, "insert sample data into Firestore (users, recipes, pav-bhaji, interactions)"),
+    "load": ("load_firestore", "bulk-load normalized_csv/ back into Firestore (restore / migrate)"),
+    "transform": ("transform_to_csv", "normalize exported JSON into normalized_csv/"),
+    "validate": ("validate_data", "validate exports / normalized CSVs into validation_output/"),
+    "check": ("post_transform_checks", "sanity checks on normalized_csv/"),
+    "insights": ("generate_insights", "compute the ten insights into analysis_output/"),
+    "insights-sharded": ("sharded_insights", "insights as partition / map / reduce phases over recipe_id shards"),
+    "leaderboard": ("leaderboard", "per-recipe rating / engagement leaderboards, updated incrementally"),
+    "funnel": ("funnel_analysis", "per-user view->like->attempt->rating funnels and sessions"),
+    "count": ("count_docs", "count Firestore documents per collection"),
+    "sql": ("sql_store", "load normalized_csv/ into SQLite/DuckDB and run insights/checks as SQL"),
+    "pipeline": (None, "run several steps in one process (default: transform validate check insights)"),
+}
+
+SEED_TARGETS = {
+    "users": "create_sample_users",
+    "recipes": "generate_synthetic_recipes",
+    "pav-bhaji": "upload_pav_bhaji",
+    "interactions": "seed_interactions",
+}
+
+PIPELINE_STEPS = ["export", "transform", "validate", "check", "insights"]
+DEFAULT_PIPELINE = ["transform", "validate", "check", "insights"]
+
+def run_module(module_name, argv=None):
+    module = importlib.import_module(module_name)
+    return module.main(argv or [])
+
+def run_command(command, argv=None):
+    """Run one command in-process, e.g. run_command("transform")."""
+    argv = list(argv or [])
+    if command == "seed":
+        ap = argparse.ArgumentParser(prog="recipelab seed", description=COMMANDS["seed"][1])
+        ap.add_argument("target", choices=list(SEED_TARGETS))
+        args, rest = ap.parse_known_args(argv)
+        return run_module(SEED_TARGETS[args.target], rest)
+    if command == "pipeline":
+        ap = argparse.ArgumentParser(prog="recipelab pipeline", description=COMMANDS["pipeline"][1])
+        ap.add_argument("steps", nargs="*", metavar="step",
+                        help=f"any of: {', '.join(PIPELINE_STEPS)}")
+        args = ap.parse_args(argv)
+        unknown = [s for s in args.steps if s not in PIPELINE_STEPS]
+        if unknown:
+            ap.error(f"unknown step(s): {', '.join(unknown)}")
+        return run_pipeline(args.steps or DEFAULT_PIPELINE)
+    module_name = COMMANDS[command][0]
+    return run_module(module_name, argv)
+
+def run_pipeline(steps=DEFAULT_PIPELINE):
+    for step in steps:
+        print(f"\n=== {step} ===")
+        run_command(step)
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog="recipelab", description="recipeLab data pipeline")
+    sub = ap.add_subparsers(dest="command", metavar="<command>")
+    sub.required = True
+    for name, (_, help_text) in COMMANDS.items():
+        sub.add_parser(name, help=help_text)
+    return ap
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in COMMANDS:
+        # options go to the command's own parser, so `recipelab <cmd> --help` works
+        return run_command(argv[0], argv[1:])
+    # no/unknown command: let argparse print usage or the error
+    build_parser().parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(main())
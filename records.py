@@ -0,0 +1,288 @@
+# records.py
+"""
+Typed records for exported documents.
+
+Recipes, interactions and users are decoded from JSON bytes (orjson when it is
+installed, else the json module) straight into slotted dataclasses. The defensive
+checks that transform_to_csv.py and validate_data.py used to repeat on every dict
+run once, in the decode:
+
+ - fields are coerced to their types (ints, stripped / lower-cased strings,
+   ingredient and step lists whether stored as a list or a map)
+ - schema problems are collected in `reasons`, with the same wording as before
+   ("missing title", "ingredient_2: missing name", "rating value not int", ...)
+
+    recipes = load_records("recipes")                   # sharded export or recipes.json
+    recipes = decode_many(blob, decode_recipe)          # from a JSON array in bytes
+    r = decode_recipe(doc_dict); r.reasons
+
+Reasons that need other collections (an interaction's recipe_id must exist) are
+added by the validator.
+
+Time spent parsing interaction timestamps is accumulated while decoding (also in
+decode worker processes, see export_shards.load_collection) and read with
+parse_timing(), so callers can report it as a stage of its own.
+"""
+
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+from dateutil import parser
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # optional speed-up
+    loads = json.loads
+
+EXPORT_DIR = Path("exported_json")
+
+ALLOWED_DIFFICULTIES = {"easy", "medium", "hard"}
+ALLOWED_INTERACTIONS = {"view", "like", "attempt", "rating"}
+EMAIL_RE = re.compile(r"^[^@]+@[^@]+\.[^@]+$")
+
+# seconds spent in timestamp parsing, interactions seen and timestamps parsed
+_parse_timing = {"seconds": 0.0, "rows": 0, "parsed": 0}
+
+@dataclass(slots=True)
+class Ingredient:
+    name: str  # stripped, lower-cased
+    quantity: str
+    order: Optional[int] = None
+
+@dataclass(slots=True)
+class Step:
+    step_number: Optional[int]
+    description: str
+
+@dataclass(slots=True)
+class Recipe:
+    recipe_id: Any
+    title: str
+    description: str
+    author_id: str
+    servings: Optional[int]
+    prep_time_minutes: Optional[int]  # None when missing or not an integer
+    cook_time_minutes: Optional[int]
+    difficulty: str  # lower-cased as given, may be "" or not allowed
+    cuisine: str
+    tags: str  # "|"-joined
+    created_at: str
+    updated_at: str
+    ingredients: list = field(default_factory=list)
+    steps: list = field(default_factory=list)
+    reasons: list = field(default_factory=list)
+
+@dataclass(slots=True)
+class Interaction:
+    interaction_id: Any  # the payload's interaction_id, else the Firestore document id
+    recipe_id: Any  # recipe_id, else the older "recipe" / "recipe_id_from_doc" fields
+    user_id: Any
+    type: str  # lower-cased as given, may be "" or not allowed
+    value: Any
+    timestamp: Any  # as stored (timestamp or created_at)
+    ts: Optional[datetime] = None  # ISO-8601 parse of timestamp
+    reasons: list = field(default_factory=list)
+    # True when interaction_id is the (auto-generated) document id: each retried add()
+    # gets a new one, so it does not identify the event
+    id_from_doc: bool = False
+
+@dataclass(slots=True)
+class User:
+    user_id: Any
+    email: Any
+    name: Any = None
+    country: Any = None
+    signup_date: Any = None
+    reasons: list = field(default_factory=list)
+
+def _int(x):
+    try:
+        return None if x is None else int(x)
+    except Exception:
+        return None
+
+def _str(x):
+    return "" if x is None else str(x)
+
+def _entries(value):
+    # lists may be stored as maps in Firestore
+    return list(value.values()) if isinstance(value, dict) else value
+
+def _nonneg_int(doc, name, reasons):
+    val = doc.get(name)
+    if val is None:
+        reasons.append(f"missing {name}")
+        return None
+    try:
+        iv = int(val)
+    except Exception:
+        reasons.append(f"{name} not integer")
+        return None
+    if iv < 0:
+        reasons.append(f"{name} negative")
+    return iv
+
+def decode_recipe(doc):
+    reasons = []
+    recipe_id = doc.get("recipe_id") or doc.get("_doc_id")
+    if not recipe_id:
+        reasons.append("missing recipe_id/_doc_id")
+    title = doc.get("title")
+    if not title:
+        reasons.append("missing title")
+    prep = _nonneg_int(doc, "prep_time_minutes", reasons)
+    cook = _nonneg_int(doc, "cook_time_minutes", reasons)
+    raw = doc.get("difficulty")
+    difficulty = str(raw).lower() if raw else ""
+    if difficulty and difficulty not in ALLOWED_DIFFICULTIES:
+        reasons.append("invalid difficulty")
+    if not difficulty:
+        reasons.append("missing difficulty")
+
+    ingredients = []
+    raw = doc.get("ingredients")
+    entries = _entries(raw) if raw else []
+    if len(entries) == 0:
+        reasons.append("empty ingredients")
+    for idx, ing in enumerate(entries, start=1):
+        if isinstance(ing, dict):
+            name = ing.get("name")
+            if not (name and str(name).strip()):
+                reasons.append(f"ingredient_{idx}: missing name")
+            ingredients.append(Ingredient(_str(name).strip().lower(), _str(ing.get("quantity")).strip(),
+                                          _int(ing.get("order"))))
+        else:
+            # a plain string is allowed (no quantity), an empty one is not
+            if not str(ing).strip():
+                reasons.append(f"ingredient_{idx}: empty entry")
+            ingredients.append(Ingredient(_str(ing).strip().lower(), ""))
+
+    steps = []
+    raw = doc.get("steps")
+    entries = _entries(raw) if raw else []
+    if len(entries) == 0:
+        reasons.append("empty steps")
+    for idx, st in enumerate(entries, start=1):
+        if isinstance(st, dict):
+            desc = st.get("description")
+            if not (desc and str(desc).strip()):
+                reasons.append(f"step_{idx}: missing description")
+            steps.append(Step(_int(st.get("step_number")), _str(desc).strip()))
+        else:
+            if not str(st).strip():
+                reasons.append(f"step_{idx}: empty description")
+            steps.append(Step(None, _str(st).strip()))
+
+    tags = doc.get("tags") or []
+    return Recipe(
+        recipe_id=recipe_id,
+        title=_str(title),
+        description=_str(doc.get("description")),
+        author_id=_str(doc.get("author_id")),
+        servings=_int(doc.get("servings")),
+        prep_time_minutes=prep,
+        cook_time_minutes=cook,
+        difficulty=difficulty,
+        cuisine=_str(doc.get("cuisine")),
+        tags="|".join(_str(t) for t in tags) if isinstance(tags, list) else _str(tags),
+        created_at=_str(doc.get("created_at")),
+        updated_at=_str(doc.get("updated_at")),
+        ingredients=ingredients,
+        steps=steps,
+        reasons=reasons,
+    )
+
+def _parse_ts(ts):
+    """(ISO-8601 datetime or None, parseable at all)."""
+    if not ts:
+        return None, False
+    try:
+        # fromisoformat (C, Python 3.11+) covers the usual exports; isoparse the rest of ISO-8601
+        return datetime.fromisoformat(ts), True
+    except (TypeError, ValueError):
+        pass
+    try:
+        return parser.isoparse(ts), True
+    except Exception:
+        try:
+            parser.parse(ts)
+            return None, True
+        except Exception:
+            return None, False
+
+def parse_timing(reset=False):
+    """Timestamp parsing totals of this process since the last reset."""
+    out = dict(_parse_timing)
+    if reset:
+        _parse_timing.update(seconds=0.0, rows=0, parsed=0)
+    return out
+
+def add_parse_timing(timing):
+    """Merge totals returned by a worker process."""
+    for k in _parse_timing:
+        _parse_timing[k] += timing[k]
+
+def decode_interaction(doc):
+    reasons = []
+    id_from_doc = not doc.get("interaction_id")
+    interaction_id = doc.get("interaction_id") or doc.get("_doc_id")
+    if not interaction_id:
+        reasons.append("missing interaction_id/_doc_id")
+    recipe_id = doc.get("recipe_id")
+    if not recipe_id:
+        reasons.append("missing recipe_id")
+        recipe_id = doc.get("recipe") or doc.get("recipe_id_from_doc")
+    raw = doc.get("type")
+    itype = str(raw).lower() if raw else ""
+    if not itype:
+        reasons.append("missing type")
+    elif itype not in ALLOWED_INTERACTIONS:
+        reasons.append("invalid type")
+    timestamp = doc.get("timestamp") or doc.get("created_at")
+    start = time.perf_counter()
+    ts, parseable = _parse_ts(timestamp)
+    _parse_timing["seconds"] += time.perf_counter() - start
+    _parse_timing["rows"] += 1
+    _parse_timing["parsed"] += ts is not None
+    if not parseable:
+        reasons.append("invalid/missing timestamp")
+    value = doc.get("value")
+    if itype == "rating":
+        try:
+            vi = int(value)
+            if vi < 1 or vi > 5:
+                reasons.append("rating value out of range")
+        except Exception:
+            reasons.append("rating value not int")
+    return Interaction(interaction_id, recipe_id, doc.get("user_id"), itype, value, timestamp, ts, reasons,
+                       id_from_doc=id_from_doc)
+
+def decode_user(doc):
+    reasons = []
+    user_id = doc.get("user_id") or doc.get("_doc_id")
+    if not user_id:
+        reasons.append("missing user_id/_doc_id")
+    email = doc.get("email")
+    if email and not EMAIL_RE.match(str(email)):
+        reasons.append("invalid email format")
+    return User(user_id, email, doc.get("name"), doc.get("country"), doc.get("signup_date"), reasons)
+
+DECODERS = {
+    "recipes": decode_recipe,
+    "interactions": decode_interaction,
+    "users": decode_user,
+}
+
+def decode_many(data, decode):
+    """Records from a JSON array given as bytes / str."""
+    return [decode(doc) for doc in loads(data)]
+
+def load_records(collection, base=EXPORT_DIR, workers=1):
+    """Typed records of an exported collection (sharded export or <collection>.json)."""
+    from export_shards import load_collection
+    return load_collection(collection, base=base, workers=workers, decode=DECODERS[collection])
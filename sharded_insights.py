@@ -0,0 +1,334 @@
+# sharded_insights.py
+"""
+Sharded (map-reduce) execution of the ten insights in generate_insights.py.
+
+    partition : split recipes, ingredients and interactions into N shards by a hash
+                of recipe_id, so everything about one recipe lands in one shard
+    map       : per shard (in a process pool), reduce the rows to small partial
+                aggregates -> <work-dir>/partial-NNNNN.json
+    reduce    : merge the partials into the same insights_summary.json /
+                insights_table.csv as the single-process run
+
+    python sharded_insights.py all --shards 8
+    python sharded_insights.py partition --shards 64            # on the machine with the CSVs
+    python sharded_insights.py map --shard-ids 0-31             # machine A (shared work dir)
+    python sharded_insights.py map --shard-ids 32-63            # machine B
+    python sharded_insights.py reduce
+
+Partials per shard:
+ - ingredient name -> count and -> summed engagement score (names span shards, so summed)
+ - prep-time histogram (value -> count), for an exact mean / median / std
+ - difficulty counts; engagement (sum, count) per difficulty; likes (sum, count) per time bucket
+ - prep/likes co-moments (n, sums, sums of squares and products) for the correlation
+ - the shard's top-10 recipes by views, average rating and like rate (recipes are
+   disjoint across shards, so the global top 10 is among the shards' top 10s)
+
+Counts and sums of whole / half-integer values are exact in any order, so the reduce
+gives the same numbers as generate_insights.py; only the std and the correlation
+are computed from merged moments and can differ in the last digit. Ties in the
+rankings break by key in both paths.
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import generate_insights as gi
+from pipeline_metrics import MetricsRecorder
+from table_loader import iter_table, read_table
+
+WORK_DIR = Path("insight_shards")
+DEFAULT_SHARDS = os.cpu_count() or 1
+TOP_K = 10
+
+metrics = MetricsRecorder("insights_sharded")
+
+def shard_of(recipe_ids, n_shards):
+    """Stable shard number per recipe_id (same on every machine and run)."""
+    h = pd.util.hash_pandas_object(recipe_ids.astype(str), index=False).to_numpy()
+    return (h % np.uint64(n_shards)).astype(np.int64)
+
+def shard_dir(work_dir, shard):
+    return Path(work_dir) / f"shard-{shard:05d}"
+
+def partial_path(work_dir, shard):
+    return Path(work_dir) / f"partial-{shard:05d}.json"
+
+def _write_json(path, obj):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    tmp.replace(path)
+
+def _read_manifest(work_dir):
+    p = Path(work_dir) / "shards.json"
+    if not p.exists():
+        raise SystemExit(f"Missing {p}. Run the partition phase first.")
+    return json.load(open(p, "r", encoding="utf-8"))
+
+def parse_shard_ids(spec, n_shards):
+    """"0-3,7" -> [0, 1, 2, 3, 7]; None -> all shards."""
+    if not spec:
+        return list(range(n_shards))
+    ids = set()
+    for part in spec.split(","):
+        lo, _, hi = part.partition("-")
+        ids.update(range(int(lo), int(hi or lo) + 1))
+    bad = [i for i in ids if not 0 <= i < n_shards]
+    if bad:
+        raise SystemExit(f"shard ids out of range 0..{n_shards - 1}: {sorted(bad)}")
+    return sorted(ids)
+
+# Partition
+
+def partition(n_shards, base=gi.BASE, work_dir=WORK_DIR, chunksize=1_000_000):
+    """Stream each table once and append its rows to the shard files (values kept verbatim)."""
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    for old in glob.glob(str(work_dir / "partial-*.json")):
+        os.remove(old)  # partials of a previous partitioning are stale
+    rows = {}
+    for table, columns in gi.TABLE_COLUMNS.items():
+        files = []
+        for s in range(n_shards):
+            shard_dir(work_dir, s).mkdir(exist_ok=True)
+            f = open(shard_dir(work_dir, s) / f"{table}.csv", "w", encoding="utf-8", newline="")
+            f.write(",".join(columns) + "\n")
+            files.append(f)
+        rows[table] = 0
+        try:
+            for chunk in iter_table(table, columns, base=base, raw=True, chunksize=chunksize):
+                shards = shard_of(chunk["recipe_id"], n_shards)
+                for s, part in chunk.groupby(shards, sort=False):
+                    part.to_csv(files[s], header=False, index=False)
+                rows[table] += len(chunk)
+        finally:
+            for f in files:
+                f.close()
+    _write_json(work_dir / "shards.json", {"n_shards": n_shards, "rows": rows})
+    return rows
+
+# Map
+
+def _top_candidates(series):
+    top = gi.top_n(series, TOP_K)
+    return [[k, float(v)] for k, v in top.items()]
+
+def _sum_count(series, by):
+    g = series.groupby(by, observed=True).agg(["sum", "count"])
+    return {str(k): [float(s), int(c)] for k, s, c in g.itertuples()}
+
+def map_shard(shard, n_shards, work_dir=WORK_DIR):
+    """Compute one shard's partial aggregates and write them next to the shard files."""
+    start = time.perf_counter()
+    d = shard_dir(work_dir, shard)
+    df_rec = read_table("recipes", gi.TABLE_COLUMNS["recipes"], base=d)
+    df_ing = read_table("ingredients", gi.TABLE_COLUMNS["ingredients"], base=d)
+    df_int = read_table("interactions", gi.TABLE_COLUMNS["interactions"], base=d)
+    df_rec = df_rec.set_index(df_rec["recipe_id"].astype(str).rename(None))
+
+    names = gi.ingredient_names(df_ing)
+    name_counts = names.value_counts()
+    name_counts = name_counts[name_counts > 0]
+
+    views = gi.count_by_recipe(df_int, "view", "views")
+    likes = gi.count_by_recipe(df_int, "like", "likes")
+    attempts = gi.count_by_recipe(df_int, "attempt", "attempts")
+    eng = pd.DataFrame({"views": views, "likes": likes, "attempts": attempts}).fillna(0)
+    eng["engagement_score"] = eng["views"] + 2*eng["likes"] + 1.5*eng["attempts"]
+    ing_scores = df_ing["recipe_id"].astype(str).map(eng["engagement_score"]).fillna(0)
+    ing_eng = ing_scores.groupby(names, observed=True).sum()
+
+    prep = df_rec["prep_time_minutes"].dropna().astype("float64")
+    prep_hist = prep.value_counts().sort_index()
+
+    diff_counts = df_rec["difficulty"].value_counts(dropna=False)
+    diff_counts = diff_counts[diff_counts > 0]
+    diff_counts.index = diff_counts.index.astype(object).fillna("unknown").astype(str)
+    diff_counts = diff_counts.groupby(level=0).sum()
+
+    rec = df_rec.join(likes.rename("likes_count"), how="left").fillna({"likes_count": 0})
+    rec = rec.join(eng[["engagement_score"]], how="left").fillna({"engagement_score": 0})
+    paired = rec[rec["prep_time_minutes"].notna()]
+    x = paired["prep_time_minutes"].astype("float64").to_numpy()
+    y = paired["likes_count"].astype("float64").to_numpy()
+
+    ratings = df_int[df_int["type"] == "rating"].groupby("recipe_id", observed=True)["value"].mean()
+    like_rate = (eng["likes"] / eng["views"]).replace([np.inf, -np.inf], np.nan).fillna(0)
+
+    partial = {
+        "shard": shard,
+        "n_shards": n_shards,
+        "rows": {"recipes": len(df_rec), "ingredients": len(df_ing), "interactions": len(df_int)},
+        "ingredient_counts": {str(k): int(v) for k, v in name_counts.items()},
+        "ingredient_engagement": {str(k): float(v) for k, v in ing_eng.items()},
+        "prep_hist": [[float(v), int(c)] for v, c in prep_hist.items()],
+        "difficulty_counts": {k: int(v) for k, v in diff_counts.items()},
+        "prep_likes_moments": {"n": len(x), "sx": float(x.sum()), "sy": float(y.sum()),
+                               "sxx": float((x * x).sum()), "syy": float((y * y).sum()),
+                               "sxy": float((x * y).sum())},
+        "top_views": _top_candidates(views),
+        "top_avg_rating": _top_candidates(ratings),
+        "top_like_rate": _top_candidates(like_rate),
+        "engagement_by_difficulty": _sum_count(rec["engagement_score"], gi.with_blank(rec["difficulty"])),
+        "likes_by_time_bucket": _sum_count(rec["likes_count"], gi.time_bucket(rec["prep_time_minutes"])),
+    }
+    _write_json(partial_path(work_dir, shard), partial)
+    return shard, partial["rows"], time.perf_counter() - start
+
+def run_map(shard_ids, n_shards, work_dir=WORK_DIR, workers=None):
+    """Map the given shards in a process pool (workers=1 runs in this process)."""
+    workers = workers or DEFAULT_SHARDS
+    if workers == 1:
+        return [map_shard(s, n_shards, work_dir) for s in shard_ids]
+    results = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(shard_ids))) as pool:
+        futures = [pool.submit(map_shard, s, n_shards, work_dir) for s in shard_ids]
+        for fut in as_completed(futures):
+            results.append(fut.result())
+    return sorted(results)
+
+# Reduce
+
+def _merge_sum(partials, key):
+    total = {}
+    for p in partials:
+        for k, v in p[key].items():
+            total[k] = total.get(k, 0) + v
+    return pd.Series(total, dtype="float64" if key == "ingredient_engagement" else "int64")
+
+def _merge_mean(partials, key):
+    sums, counts = {}, {}
+    for p in partials:
+        for k, (s, c) in p[key].items():
+            sums[k] = sums.get(k, 0.0) + s
+            counts[k] = counts.get(k, 0) + c
+    return pd.Series({k: sums[k] / counts[k] for k in sorted(sums)}, dtype="float64")
+
+def _merge_top(partials, key):
+    cands = {k: v for p in partials for k, v in p[key]}
+    return gi.top_n(pd.Series(cands, dtype="float64"), TOP_K)
+
+def _prep_stats(partials):
+    hist = {}
+    for p in partials:
+        for v, c in p["prep_hist"]:
+            hist[v] = hist.get(v, 0) + c
+    if not hist:
+        return {"mean": None, "median": None, "std": None}
+    values = np.array(sorted(hist), dtype="float64")
+    counts = np.array([hist[v] for v in values], dtype=np.int64)
+    n = int(counts.sum())
+    mean = float((values * counts).sum() / n)
+    cum = np.cumsum(counts)
+    lo = values[np.searchsorted(cum, (n - 1) // 2, side="right")]
+    hi = values[np.searchsorted(cum, n // 2, side="right")]
+    std = float(math.sqrt((counts * (values - mean) ** 2).sum() / (n - 1))) if n > 1 else float("nan")
+    return {"mean": mean, "median": float((lo + hi) / 2), "std": std}
+
+def _correlation(partials):
+    m = {k: sum(p["prep_likes_moments"][k] for p in partials) for k in ("n", "sx", "sy", "sxx", "syy", "sxy")}
+    n = m["n"]
+    if n <= 2:
+        return None
+    cov = m["sxy"] - m["sx"] * m["sy"] / n
+    var_x = m["sxx"] - m["sx"] ** 2 / n
+    var_y = m["syy"] - m["sy"] ** 2 / n
+    if var_x <= 0 or var_y <= 0:
+        return float("nan")
+    return float(cov / math.sqrt(var_x * var_y))
+
+def load_partials(work_dir=WORK_DIR):
+    n_shards = _read_manifest(work_dir)["n_shards"]
+    missing = [s for s in range(n_shards) if not partial_path(work_dir, s).exists()]
+    if missing:
+        raise SystemExit(f"{len(missing)} shard(s) not mapped yet: {missing[:10]}")
+    return [json.load(open(partial_path(work_dir, s), "r", encoding="utf-8")) for s in range(n_shards)]
+
+def reduce_partials(partials):
+    """Merge shard partials into the summary dict of generate_insights.compute_insights()."""
+    diff_dist = _merge_sum(partials, "difficulty_counts")
+    eng_by_diff = _merge_mean(partials, "engagement_by_difficulty")
+    return {
+        "most_common_ingredients": gi.top_n(_merge_sum(partials, "ingredient_counts"), 15).to_dict(),
+        "avg_prep_time": _prep_stats(partials),
+        "difficulty_distribution": gi.top_n(diff_dist, len(diff_dist)).to_dict(),
+        "prep_likes_correlation": _correlation(partials),
+        "top_viewed_recipes": {k: int(v) for k, v in _merge_top(partials, "top_views").items()},
+        "ingredients_high_engagement": gi.top_n(_merge_sum(partials, "ingredient_engagement"), 15).to_dict(),
+        "top_rated_recipes_avg_rating": _merge_top(partials, "top_avg_rating").to_dict(),
+        "top_conversion_like_rate": _merge_top(partials, "top_like_rate").to_dict(),
+        "engagement_by_difficulty": gi.top_n(eng_by_diff, len(eng_by_diff)).to_dict(),
+        "avg_likes_by_time_bucket": _merge_mean(partials, "likes_by_time_bucket").to_dict(),
+    }
+
+# CLI
+
+def _record_shards(recorder, results):
+    # map_shard times itself in its worker; one sub-stage per shard
+    for shard, rows, seconds in results:
+        recorder.add_stage(f"shard_{shard:05d}", seconds, rows_in=sum(rows.values()))
+
+def run_all(n_shards=DEFAULT_SHARDS, workers=None, base=gi.BASE, work_dir=WORK_DIR, recorder=None):
+    """
+    partition -> map -> reduce in one go; returns the summary dict. Stages go to
+    `recorder` (e.g. generate_insights.metrics when called from there), else to
+    this module's recorder.
+    """
+    recorder = recorder or metrics
+    with recorder.stage("partition") as st:
+        rows = partition(n_shards, base=base, work_dir=work_dir)
+        st.rows_out = sum(rows.values())
+    with recorder.stage("map", rows_in=sum(rows.values())) as st:
+        results = run_map(list(range(n_shards)), n_shards, work_dir, workers)
+        _record_shards(recorder, results)
+        st.rows_out = len(results)
+    with recorder.stage("reduce", rows_in=n_shards):
+        return reduce_partials(load_partials(work_dir))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compute the ten insights as partition -> map -> reduce over recipe_id shards.")
+    ap.add_argument("phase", choices=["partition", "map", "reduce", "all"])
+    ap.add_argument("--shards", type=int, default=DEFAULT_SHARDS, help="number of shards (partition/all)")
+    ap.add_argument("--workers", type=int, default=None, help="map processes (default: CPU count)")
+    ap.add_argument("--shard-ids", help='shards to map on this machine, e.g. "0-7,12" (default: all)')
+    ap.add_argument("--work-dir", default=str(WORK_DIR), help="shard files and partials; share it between machines")
+    args = ap.parse_args(argv)
+    if args.shards < 1:
+        ap.error("--shards must be >= 1")
+    metrics.reset()
+    work_dir = Path(args.work_dir)
+
+    if args.phase == "partition":
+        with metrics.stage("partition") as st:
+            rows = partition(args.shards, work_dir=work_dir)
+            st.rows_out = sum(rows.values())
+        print(f"Partitioned {rows} into {args.shards} shards under {work_dir}")
+    elif args.phase == "map":
+        n_shards = _read_manifest(work_dir)["n_shards"]
+        shard_ids = parse_shard_ids(args.shard_ids, n_shards)
+        with metrics.stage("map") as st:
+            results = run_map(shard_ids, n_shards, work_dir, args.workers)
+            _record_shards(metrics, results)
+            st.rows_out = len(results)
+        for shard, rows, seconds in results:
+            print(f" shard {shard:5d}: {rows} in {seconds:.3f}s")
+    else:
+        if args.phase == "all":
+            summary = run_all(args.shards, args.workers, work_dir=work_dir)
+        else:
+            with metrics.stage("reduce"):
+                summary = reduce_partials(load_partials(work_dir))
+        gi.write_outputs(summary)
+        gi.print_summary(summary)
+    metrics.print_summary()
+    metrics.write()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+# sql_store.py
+"""
+Embedded analytical store for the normalized tables.
+
+Loads recipes / ingredients / steps / interactions into typed, indexed tables in
+SQLite (stdlib, default) or DuckDB (optional, used when the path ends in .duckdb),
+and exposes the ten insights and the post-transform integrity checks as SQL that
+runs inside the engine.
+
+    python sql_store.py --db normalized.sqlite                 # load normalized_csv/
+    python sql_store.py --db normalized.duckdb --insights      # load + print insights
+    python sql_store.py --db normalized.sqlite --no-load --checks
+
+The queries only use SQL understood by both engines. Top-N lists break ties by
+key, so the order among equal values can differ from the pandas path.
+"""
+
+import argparse
+import json
+import math
+import sqlite3
+from pathlib import Path
+
+NORMALIZED_DIR = Path("normalized_csv")
+
+# logical column types, mapped per engine below
+SCHEMA = {
+    "recipes": [
+        ("recipe_id", "text"), ("title", "text"), ("description", "text"), ("author_id", "text"),
+        ("servings", "int"), ("prep_time_minutes", "int"), ("cook_time_minutes", "int"),
+        ("total_time_minutes", "int"), ("difficulty", "text"), ("cuisine", "text"), ("tags", "text"),
+        ("created_at", "text"), ("updated_at", "text"),
+    ],
+    "ingredients": [
+        ("recipe_id", "text"), ("ingredient_id", "text"), ("name", "text"), ("quantity", "text"),
+        ("order", "int"),
+    ],
+    "steps": [
+        ("recipe_id", "text"), ("step_number", "int"), ("description", "text"),
+    ],
+    "interactions": [
+        ("interaction_id", "text"), ("recipe_id", "text"), ("user_id", "text"), ("type", "text"),
+        ("value", "real"), ("timestamp", "timestamp"),
+    ],
+}
+
+INDEXES = [
+    ("recipes", "recipe_id"),
+    ("ingredients", "recipe_id"),
+    ("steps", "recipe_id"),
+    ("interactions", "recipe_id"),
+    ("interactions", "user_id"),
+    ("interactions", "type"),
+    ("interactions", "timestamp"),
+]
+
+# SQLite keeps timestamps as ISO-8601 text, which sorts chronologically
+ENGINE_TYPES = {
+    "sqlite": {"text": "TEXT", "int": "INTEGER", "real": "REAL", "timestamp": "TEXT"},
+    "duckdb": {"text": "VARCHAR", "int": "INTEGER", "real": "DOUBLE", "timestamp": "TIMESTAMPTZ"},
+}
+
+def engine_for(path):
+    return "duckdb" if str(path).endswith(".duckdb") else "sqlite"
+
+def connect(path):
+    """Returns (connection, engine name)."""
+    engine = engine_for(path)
+    if engine == "duckdb":
+        try:
+            import duckdb
+        except ImportError:
+            raise SystemExit("duckdb is not installed (pip install duckdb), or use a .sqlite path.")
+        return duckdb.connect(str(path)), engine
+    return sqlite3.connect(str(path)), engine
+
+def open_store(path):
+    """
+    Connection to an existing, loaded store; exits with a hint instead of creating
+    an empty database file when there is none.
+    """
+    hint = f"Run `recipelab sql --db {path}` or `recipelab transform --db {path}` first."
+    if not Path(path).exists():
+        raise SystemExit(f"{path} not found. {hint}")
+    conn, engine = connect(path)
+    if engine == "duckdb":
+        sql = "SELECT table_name FROM information_schema.tables"
+    else:
+        sql = "SELECT name FROM sqlite_master WHERE type = 'table'"
+    missing = set(SCHEMA) - {r[0] for r in conn.execute(sql).fetchall()}
+    if missing:
+        conn.close()
+        raise SystemExit(f"{path} has no {', '.join(sorted(missing))} table(s). {hint}")
+    return conn, engine
+
+def _quote(name):
+    return f'"{name}"'
+
+def create_tables(conn, engine):
+    types = ENGINE_TYPES[engine]
+    for table, cols in SCHEMA.items():
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        col_sql = ", ".join(f"{_quote(c)} {types[t]}" for c, t in cols)
+        conn.execute(f"CREATE TABLE {table} ({col_sql})")
+
+def create_indexes(conn):
+    for table, col in INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table} ({_quote(col)})")
+
+def _prepare_frame(df, table):
+    """Coerce a normalized DataFrame to the table's column list and Python-native values."""
+    import pandas as pd
+    cols = SCHEMA[table]
+    out = pd.DataFrame(index=df.index)
+    for c, t in cols:
+        col = df[c] if c in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if t in ("int", "real"):
+            col = pd.to_numeric(col, errors="coerce")
+        elif t == "timestamp":
+            col = col.astype(object).where(col.notna() & (col.astype(str) != ""), None)
+        elif c == "type":
+            col = col.str.lower()
+        out[c] = col
+    out = out.astype(object).where(out.notna(), None)
+    # whole-number columns arrive as floats when they contain NaN
+    for c, t in cols:
+        if t == "int":
+            out[c] = [int(v) if v is not None else None for v in out[c]]
+    return out
+
+def insert_frame(conn, engine, table, df):
+    frame = _prepare_frame(df, table)
+    names = [c for c, _ in SCHEMA[table]]
+    if engine == "duckdb":
+        # vectorized load straight from the DataFrame
+        types = ENGINE_TYPES[engine]
+        select = ", ".join(f"TRY_CAST({_quote(c)} AS {types[t]})" for c, t in SCHEMA[table])
+        conn.register("_frame", frame)
+        conn.execute(f"INSERT INTO {table} SELECT {select} FROM _frame")
+        conn.unregister("_frame")
+    else:
+        placeholders = ", ".join("?" for _ in names)
+        conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})",
+                         frame.itertuples(index=False, name=None))
+    return len(frame)
+
+def load_frames(path, frames):
+    """
+    (Re)create the store at `path` from a dict of table name -> DataFrame.
+    Returns the open connection and engine.
+    """
+    conn, engine = connect(path)
+    create_tables(conn, engine)
+    for table in SCHEMA:
+        if table in frames:
+            insert_frame(conn, engine, table, frames[table])
+    create_indexes(conn)
+    conn.commit()
+    return conn, engine
+
+def load_csv_dir(path, csv_dir=NORMALIZED_DIR):
+    import pandas as pd
+    frames = {}
+    for table in SCHEMA:
+        p = Path(csv_dir) / f"{table}.csv"
+        if p.exists():
+            frames[table] = pd.read_csv(p, dtype=str, keep_default_na=False, na_values=[""])
+    return load_frames(path, frames)
+
+# ---------------------------------------------------------------------------
+# Insights as SQL
+# ---------------------------------------------------------------------------
+
+# per-recipe engagement, shared by insights 6, 8 and 9
+_ENGAGEMENT_CTE = """
+eng AS (
+    SELECT recipe_id,
+           SUM(CASE WHEN type = 'view' THEN 1 ELSE 0 END) AS views,
+           SUM(CASE WHEN type = 'like' THEN 1 ELSE 0 END) AS likes,
+           SUM(CASE WHEN type = 'attempt' THEN 1 ELSE 0 END) AS attempts,
+           SUM(CASE WHEN type = 'view' THEN 1.0 WHEN type = 'like' THEN 2.0
+                    WHEN type = 'attempt' THEN 1.5 ELSE 0.0 END) AS engagement_score
+    FROM interactions
+    WHERE type IN ('view', 'like', 'attempt')
+    GROUP BY recipe_id
+)"""
+
+_LIKES_CTE = """
+likes AS (
+    SELECT recipe_id, COUNT(*) AS likes_count
+    FROM interactions WHERE type = 'like' GROUP BY recipe_id
+)"""
+
+INSIGHT_QUERIES = {
+    "most_common_ingredients": """
+        SELECT LOWER(TRIM(COALESCE(name, ''))) AS k, COUNT(*) AS n
+        FROM ingredients GROUP BY k ORDER BY n DESC, k LIMIT 15""",
+    "prep_time_stats": """
+        WITH v AS (SELECT prep_time_minutes AS x FROM recipes WHERE prep_time_minutes IS NOT NULL),
+             m AS (SELECT COUNT(*) AS n, AVG(x) AS mean FROM v)
+        SELECT m.n, m.mean,
+               (SELECT SUM((v.x - m.mean) * (v.x - m.mean)) FROM v) AS ssd
+        FROM m""",
+    "prep_time_median": """
+        WITH v AS (
+            SELECT prep_time_minutes AS x,
+                   ROW_NUMBER() OVER (ORDER BY prep_time_minutes) AS rn,
+                   COUNT(*) OVER () AS c
+            FROM recipes WHERE prep_time_minutes IS NOT NULL
+        )
+        SELECT AVG(x) FROM v WHERE 2 * rn BETWEEN c AND c + 2""",
+    "difficulty_distribution": """
+        SELECT COALESCE(NULLIF(LOWER(difficulty), ''), 'unknown') AS k, COUNT(*) AS n
+        FROM recipes GROUP BY k ORDER BY n DESC, k""",
+    "prep_likes_moments": f"""
+        WITH {_LIKES_CTE.strip()},
+        p AS (
+            SELECT r.prep_time_minutes AS x, COALESCE(l.likes_count, 0) AS y
+            FROM recipes r LEFT JOIN likes l ON l.recipe_id = r.recipe_id
+            WHERE r.prep_time_minutes IS NOT NULL
+        )
+        SELECT COUNT(*), SUM(x), SUM(y), SUM(x * x), SUM(y * y), SUM(x * y) FROM p""",
+    "top_viewed_recipes": """
+        SELECT recipe_id, COUNT(*) AS n FROM interactions WHERE type = 'view'
+        GROUP BY recipe_id ORDER BY n DESC, recipe_id LIMIT 10""",
+    "ingredients_high_engagement": f"""
+        WITH {_ENGAGEMENT_CTE.strip()}
+        SELECT LOWER(TRIM(COALESCE(i.name, ''))) AS k, SUM(COALESCE(e.engagement_score, 0)) AS s
+        FROM ingredients i LEFT JOIN eng e ON e.recipe_id = i.recipe_id
+        GROUP BY k ORDER BY s DESC, k LIMIT 15""",
+    "top_rated_recipes_avg_rating": """
+        SELECT recipe_id, AVG(value) AS avg_rating FROM interactions WHERE type = 'rating'
+        GROUP BY recipe_id ORDER BY avg_rating DESC NULLS LAST, recipe_id LIMIT 10""",
+    "top_conversion_like_rate": f"""
+        WITH {_ENGAGEMENT_CTE.strip()}
+        SELECT recipe_id,
+               CASE WHEN views > 0 THEN likes * 1.0 / views ELSE 0.0 END AS like_rate
+        FROM eng ORDER BY like_rate DESC, recipe_id LIMIT 10""",
+    "engagement_by_difficulty": f"""
+        WITH {_ENGAGEMENT_CTE.strip()}
+        SELECT LOWER(COALESCE(r.difficulty, '')) AS k, AVG(COALESCE(e.engagement_score, 0)) AS s
+        FROM recipes r LEFT JOIN eng e ON e.recipe_id = r.recipe_id
+        GROUP BY k ORDER BY s DESC, k""",
+    "avg_likes_by_time_bucket": f"""
+        WITH {_LIKES_CTE.strip()}
+        SELECT CASE WHEN r.prep_time_minutes IS NULL THEN 'unknown'
+                    WHEN r.prep_time_minutes < 15 THEN 'short'
+                    WHEN r.prep_time_minutes <= 30 THEN 'medium'
+                    ELSE 'long' END AS bucket,
+               AVG(COALESCE(l.likes_count, 0) * 1.0) AS avg_likes
+        FROM recipes r LEFT JOIN likes l ON l.recipe_id = r.recipe_id
+        GROUP BY bucket ORDER BY bucket""",
+}
+
+def _pairs(conn, sql):
+    return {k: v for k, v in conn.execute(sql).fetchall()}
+
+def run_insights(conn):
+    """Computes the same summary structure as generate_insights.compute_insights, in SQL."""
+    q = INSIGHT_QUERIES
+    n, mean, ssd = conn.execute(q["prep_time_stats"]).fetchone()
+    median = conn.execute(q["prep_time_median"]).fetchone()[0]
+    std = math.sqrt(ssd / (n - 1)) if n and n > 1 else None
+
+    cnt, sx, sy, sxx, syy, sxy = conn.execute(q["prep_likes_moments"]).fetchone()
+    corr = None
+    if cnt and cnt > 2:
+        cov = sxy - sx * sy / cnt
+        var_x = sxx - sx * sx / cnt
+        var_y = syy - sy * sy / cnt
+        corr = cov / math.sqrt(var_x * var_y) if var_x > 0 and var_y > 0 else float("nan")
+
+    return {
+        "most_common_ingredients": _pairs(conn, q["most_common_ingredients"]),
+        "avg_prep_time": {
+            "mean": float(mean) if n else None,
+            "median": float(median) if n else None,
+            "std": std,
+        },
+        "difficulty_distribution": _pairs(conn, q["difficulty_distribution"]),
+        "prep_likes_correlation": corr,
+        "top_viewed_recipes": _pairs(conn, q["top_viewed_recipes"]),
+        "ingredients_high_engagement": {k: float(v) for k, v in _pairs(conn, q["ingredients_high_engagement"]).items()},
+        "top_rated_recipes_avg_rating": _pairs(conn, q["top_rated_recipes_avg_rating"]),
+        "top_conversion_like_rate": {k: float(v) for k, v in _pairs(conn, q["top_conversion_like_rate"]).items()},
+        "engagement_by_difficulty": {k: float(v) for k, v in _pairs(conn, q["engagement_by_difficulty"]).items()},
+        "avg_likes_by_time_bucket": _pairs(conn, q["avg_likes_by_time_bucket"]),
+    }
+
+# ---------------------------------------------------------------------------
+# Integrity checks as SQL (mirrors post_transform_checks.py)
+# ---------------------------------------------------------------------------
+
+CHECK_QUERIES = {
+    "recipes_without_ingredients": """
+        SELECT r.recipe_id FROM recipes r
+        WHERE NOT EXISTS (SELECT 1 FROM ingredients i WHERE i.recipe_id = r.recipe_id)
+        ORDER BY r.recipe_id""",
+    "recipes_without_steps": """
+        SELECT r.recipe_id FROM recipes r
+        WHERE NOT EXISTS (SELECT 1 FROM steps s WHERE s.recipe_id = r.recipe_id)
+        ORDER BY r.recipe_id""",
+    "interactions_missing_timestamp": """
+        SELECT interaction_id FROM interactions WHERE timestamp IS NULL ORDER BY interaction_id""",
+    "interactions_unknown_recipe": """
+        SELECT i.interaction_id FROM interactions i
+        WHERE NOT EXISTS (SELECT 1 FROM recipes r WHERE r.recipe_id = i.recipe_id)
+        ORDER BY i.interaction_id""",
+    "ratings_out_of_range": """
+        SELECT interaction_id FROM interactions
+        WHERE type = 'rating' AND (value IS NULL OR value < 1 OR value > 5)
+        ORDER BY interaction_id""",
+}
+
+def table_counts(conn):
+    return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in SCHEMA}
+
+def run_checks(conn):
+    """Returns {check name: list of offending ids}."""
+    return {name: [r[0] for r in conn.execute(sql).fetchall()] for name, sql in CHECK_QUERIES.items()}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load normalized_csv/ into SQLite/DuckDB and query it.")
+    ap.add_argument("--db", required=True, help="database file (.sqlite/.db for SQLite, .duckdb for DuckDB)")
+    ap.add_argument("--csv-dir", default=str(NORMALIZED_DIR))
+    ap.add_argument("--no-load", action="store_true", help="query an existing store without reloading")
+    ap.add_argument("--insights", action="store_true", help="print the ten insights computed in SQL")
+    ap.add_argument("--checks", action="store_true", help="print the integrity checks computed in SQL")
+    args = ap.parse_args(argv)
+
+    if args.no_load:
+        conn, engine = open_store(args.db)
+    else:
+        conn, engine = load_csv_dir(args.db, args.csv_dir)
+        print(f"Loaded {args.csv_dir} into {args.db} ({engine}):", table_counts(conn))
+    if args.insights:
+        print(json.dumps(run_insights(conn), indent=2, ensure_ascii=False))
+    if args.checks:
+        print("Counts:", table_counts(conn))
+        for name, ids in run_checks(conn).items():
+            print(f"{name}: {len(ids)} {ids[:5]}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# table_loader.py
+"""
+Schema-driven loader for the normalized CSV tables.
+
+Reads only the requested columns, with compact dtypes decided by SCHEMA:
+ - category  : low-cardinality / repeated keys (type, difficulty, cuisine, recipe_id, user_id)
+ - int       : parsed numerically and downcast to the smallest integer type
+               (nullable Int32 when the column has missing values)
+ - float     : float64
+ - datetime  : parsed once, natively (ISO-8601, UTC); unparseable -> NaT
+ - str       : left as strings
+
+Columns listed in the schema but missing from a file come back as all-missing,
+so older CSVs still load. `raw=True` reads the same columns as plain strings with
+"" for missing values (what the validator needs to report bad values verbatim).
+
+    df = read_table("interactions", columns=["recipe_id", "type", "value"])
+    for chunk in iter_table("interactions", chunksize=1_000_000): ...
+"""
+
+from pathlib import Path
+import pandas as pd
+
+BASE = Path("normalized_csv")
+
+# column -> kind; "lower" kinds are lower-cased before conversion
+SCHEMA = {
+    "recipes": {
+        "recipe_id": "str",  # unique per row, a category would not save anything
+        "title": "str",
+        "description": "str",
+        "author_id": "category",
+        "servings": "int",
+        "prep_time_minutes": "int",
+        "cook_time_minutes": "int",
+        "total_time_minutes": "int",
+        "difficulty": "category_lower",
+        "cuisine": "category",
+        "tags": "str",
+        "created_at": "datetime",
+        "updated_at": "datetime",
+    },
+    "ingredients": {
+        "recipe_id": "category",
+        "ingredient_id": "str",
+        "name": "category_lower",
+        "quantity": "str",
+        "order": "int",
+    },
+    "steps": {
+        "recipe_id": "category",
+        "step_number": "int",
+        "description": "str",
+    },
+    "interactions": {
+        "interaction_id": "str",
+        "recipe_id": "category",
+        "user_id": "category",
+        "type": "category_lower",
+        "value": "float",
+        "timestamp": "datetime",
+    },
+}
+
+def _path(name, base):
+    p = Path(base) / f"{name}.csv"
+    if not p.exists():
+        raise FileNotFoundError(f"Missing {p}. Run transform_to_csv.py first.")
+    return p
+
+def _read_args(name, columns, base, raw):
+    schema = SCHEMA[name]
+    columns = list(columns) if columns is not None else list(schema)
+    unknown = [c for c in columns if c not in schema]
+    if unknown:
+        raise KeyError(f"{name} has no column(s) {unknown} in SCHEMA")
+    p = _path(name, base)
+    header = pd.read_csv(p, nrows=0).columns
+    usecols = [c for c in columns if c in header]
+    if raw:
+        dtype = {c: str for c in usecols}
+    else:
+        # category / str columns can be typed by the parser directly; numbers and
+        # dates are converted afterwards so that bad values become NaN/NaT
+        dtype = {c: ("category" if schema[c].startswith("category") else str) for c in usecols}
+    return p, columns, usecols, dtype
+
+def _finish(df, name, columns, raw):
+    schema = SCHEMA[name]
+    missing = [c for c in columns if c not in df.columns]
+    for c in missing:
+        df[c] = "" if raw else pd.Series(pd.NA, index=df.index, dtype=object)
+    if raw:
+        return df[columns].fillna("")
+    for c in columns:
+        kind = schema[c]
+        if c in missing:
+            continue
+        if kind == "int":
+            col = pd.to_numeric(df[c], errors="coerce")
+            if not col.isna().any():
+                df[c] = pd.to_numeric(col, downcast="integer")
+            else:
+                try:
+                    df[c] = col.astype("Int32")
+                except (TypeError, ValueError):
+                    df[c] = col  # fractional or out of range: keep float64
+        elif kind == "float":
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+        elif kind == "datetime":
+            df[c] = pd.to_datetime(df[c], format="ISO8601", utc=True, errors="coerce")
+        elif kind == "category_lower":
+            lowered = df[c].cat.categories.str.lower()
+            if lowered.is_unique:
+                # only the (few) categories are touched, not every row
+                df[c] = df[c].cat.rename_categories(lowered)
+            else:
+                df[c] = df[c].str.lower().astype("category")
+    return df[columns]
+
+def read_table(name, columns=None, base=BASE, raw=False):
+    p, columns, usecols, dtype = _read_args(name, columns, base, raw)
+    df = pd.read_csv(p, usecols=usecols, dtype=dtype)
+    return _finish(df, name, columns, raw)
+
+def iter_table(name, columns=None, base=BASE, raw=False, chunksize=1_000_000):
+    """Yields typed chunks; categories are per chunk, so align them before concatenating."""
+    p, columns, usecols, dtype = _read_args(name, columns, base, raw)
+    for chunk in pd.read_csv(p, usecols=usecols, dtype=dtype, chunksize=chunksize):
+        yield _finish(chunk, name, columns, raw)
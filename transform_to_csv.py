@@ -1,188 +1,214 @@
 # transform_to_csv.py
-import json
+import argparse
 from pathlib import Path
 import pandas as pd
 import uuid
-from dateutil import parser
+from pipeline_metrics import MetricsRecorder, profiled
+from dedup import BloomFilter, deduplicate_interactions, remember_interactions
+from records import ALLOWED_DIFFICULTIES, ALLOWED_INTERACTIONS, load_records, parse_timing
 
 INPUT_DIR = Path("exported_json")
 OUTPUT_DIR = Path("normalized_csv")
-ALLOWED_DIFFICULTIES = {"easy", "medium", "hard"}
-ALLOWED_INTERACTIONS = {"view", "like", "attempt", "rating"}
 
-def load_json(filename):
-    p = INPUT_DIR / filename
-    if not p.exists():
-        raise FileNotFoundError(f"{p} not found. Run export_firestore.py first.")
-    return json.load(open(p, "r", encoding="utf-8"))
+metrics = MetricsRecorder("transform")
 
-def safe_int(x, default=None):
-    try:
-        if x is None:
-            return default
-        return int(x)
-    except Exception:
-        return default
-
-def safe_str(x, default=""):
-    if x is None:
-        return default
-    return str(x)
-
-def normalize_recipes(recipes_raw):
+def load_json(collection, workers=1):
+    """Typed records (records.py) of a collection: sharded export if present, else <collection>.json."""
+    return load_records(collection, base=INPUT_DIR, workers=workers)
+
+@profiled()
+def normalize_recipes(recipes):
     rows = []
     ingredients_rows = []
     steps_rows = []
 
-    for doc in recipes_raw:
-        # prefer explicit recipe_id field; else use Firestore doc id
-        recipe_id = doc.get("recipe_id") or doc.get("_doc_id")
-        title = safe_str(doc.get("title"))
-        description = safe_str(doc.get("description", ""))
-        author_id = safe_str(doc.get("author_id", ""))
-        servings = safe_int(doc.get("servings"), default=None)
-        prep = safe_int(doc.get("prep_time_minutes"), default=0)
-        cook = safe_int(doc.get("cook_time_minutes"), default=0)
-        total = prep + cook
-        difficulty = (doc.get("difficulty") or "").lower()
-        if difficulty not in ALLOWED_DIFFICULTIES:
-            # if missing or invalid, set to 'medium' as default
-            difficulty = "medium"
-        cuisine = safe_str(doc.get("cuisine", ""))
-        tags = doc.get("tags") or []
-        if isinstance(tags, list):
-            tags_join = "|".join([safe_str(t) for t in tags])
-        else:
-            tags_join = safe_str(tags)
-
+    for r in recipes:
+        prep = r.prep_time_minutes if r.prep_time_minutes is not None else 0
+        cook = r.cook_time_minutes if r.cook_time_minutes is not None else 0
         rows.append({
-            "recipe_id": recipe_id,
-            "title": title,
-            "description": description,
-            "author_id": author_id,
-            "servings": servings,
+            "recipe_id": r.recipe_id,
+            "title": r.title,
+            "description": r.description,
+            "author_id": r.author_id,
+            "servings": r.servings,
             "prep_time_minutes": prep,
             "cook_time_minutes": cook,
-            "total_time_minutes": total,
-            "difficulty": difficulty,
-            "cuisine": cuisine,
-            "tags": tags_join,
-            "created_at": safe_str(doc.get("created_at", "")),
-            "updated_at": safe_str(doc.get("updated_at", ""))
+            "total_time_minutes": prep + cook,
+            # if missing or invalid, set to 'medium' as default
+            "difficulty": r.difficulty if r.difficulty in ALLOWED_DIFFICULTIES else "medium",
+            "cuisine": r.cuisine,
+            "tags": r.tags,
+            "created_at": r.created_at,
+            "updated_at": r.updated_at
         })
 
-        # Ingredients
-        ingredients = doc.get("ingredients") or []
-        if isinstance(ingredients, dict):
-            # handle case where ingredients stored as map rather than list
-            ingredients = list(ingredients.values())
-
-        for ing in ingredients:
-            # each ing should be dict with name, quantity, order (order optional)
-            name = safe_str(ing.get("name") if isinstance(ing, dict) else ing)
-            quantity = safe_str(ing.get("quantity") if isinstance(ing, dict) else "")
-            order = safe_int(ing.get("order") if isinstance(ing, dict) else None, default=None)
-            ingredient_id = str(uuid.uuid4())
+        for ing in r.ingredients:
             ingredients_rows.append({
-                "recipe_id": recipe_id,
-                "ingredient_id": ingredient_id,
-                "name": name.strip().lower(),
-                "quantity": quantity.strip(),
-                "order": order
+                "recipe_id": r.recipe_id,
+                "ingredient_id": str(uuid.uuid4()),
+                "name": ing.name,
+                "quantity": ing.quantity,
+                "order": ing.order
             })
 
-        # Steps
-        steps = doc.get("steps") or []
-        if isinstance(steps, dict):
-            steps = list(steps.values())
-        for s in steps:
-            step_number = safe_int(s.get("step_number") if isinstance(s, dict) else None, default=None)
-            description = safe_str(s.get("description") if isinstance(s, dict) else s)
-            # If step_number missing, we will assign later based on order
+        for step in r.steps:
             steps_rows.append({
-                "recipe_id": recipe_id,
-                "step_number": step_number,
-                "description": description.strip()
+                "recipe_id": r.recipe_id,
+                "step_number": step.step_number,
+                "description": step.description
             })
 
-    # Post-process: set missing step_number sequentially per recipe
-    df_steps = pd.DataFrame(steps_rows)
-    if not df_steps.empty:
-        df_steps["step_number"] = (
-    df_steps.groupby("recipe_id").cumcount() + 1
-)
-        # for any still-NaN step_numbers, assign by appearance order
-        def assign_seq(sub):
-            if sub["step_number"].isnull().any():
-                sub = sub.reset_index(drop=True)
-                seqs = list(range(1, len(sub) + 1))
-                sub["step_number"] = sub["step_number"].fillna(pd.Series(seqs))
-            return sub
-        df_steps = df_steps.groupby("recipe_id", group_keys=False).apply(assign_seq)
-    else:
-        df_steps = pd.DataFrame(columns=["recipe_id", "step_number", "description"])
+    # Post-process: number steps sequentially per recipe, in stored order
+    with metrics.stage("renumber_steps", rows_in=len(steps_rows)) as st:
+        df_steps = pd.DataFrame(steps_rows, columns=["recipe_id", "step_number", "description"])
+        if not df_steps.empty:
+            df_steps["step_number"] = df_steps.groupby("recipe_id").cumcount() + 1
+        st.rows_out = len(df_steps)
 
     df_recipes = pd.DataFrame(rows)
     df_ingredients = pd.DataFrame(ingredients_rows)
 
     return df_recipes, df_ingredients, df_steps
 
-def normalize_interactions(inter_raw):
+@profiled()
+def normalize_interactions(interactions):
     rows = []
-    for it in inter_raw:
-        interaction_id = it.get("interaction_id") or it.get("_doc_id") or str(uuid.uuid4())
-        recipe_id = it.get("recipe_id") or it.get("recipe") or it.get("recipe_id_from_doc")
-        user_id = it.get("user_id")  # allow None (anonymous)
-        itype = (it.get("type") or "").lower()
-        if itype not in ALLOWED_INTERACTIONS:
-            # if unknown type, fallback to 'view'
-            itype = "view"
-        value = it.get("value")
-        timestamp = it.get("timestamp") or it.get("created_at") or ""
-        # try to normalize timestamp to ISO8601
-        try:
-            timestamp_normal = parser.isoparse(timestamp).isoformat()
-        except Exception:
-            timestamp_normal = ""
+    for it in interactions:
         rows.append({
-            "interaction_id": interaction_id,
-            "recipe_id": recipe_id,
-            "user_id": user_id,
-            "type": itype,
-            "value": value,
-            "timestamp": timestamp_normal
+            # only the payload's own id identifies an event (document ids differ between
+            # retried writes); missing ids are filled from a content fingerprint in the dedup stage
+            "interaction_id": None if it.id_from_doc else it.interaction_id,
+            "recipe_id": it.recipe_id,
+            "user_id": it.user_id,  # allow None (anonymous)
+            # if unknown type, fallback to 'view'
+            "type": it.type if it.type in ALLOWED_INTERACTIONS else "view",
+            "value": it.value,
+            # timestamps were parsed while decoding; normalize to ISO8601
+            "timestamp": it.ts.isoformat() if it.ts is not None else ""
         })
-    df = pd.DataFrame(rows)
+    df = pd.DataFrame(rows, columns=["interaction_id", "recipe_id", "user_id", "type", "value", "timestamp"])
     return df
 
-def main():
+def append_csv(df, path):
+    """
+    Append rows to an existing CSV with the same header. If writing fails the file
+    is truncated back to its previous size, so no partial rows are left behind.
+    """
+    header = list(pd.read_csv(path, nrows=0).columns)
+    if header != list(df.columns):
+        raise SystemExit(f"{path} has columns {header}, expected {list(df.columns)}; rerun without --bloom")
+    size = path.stat().st_size
+    try:
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            df.to_csv(f, index=False, header=False)
+    except BaseException:
+        with open(path, "r+b") as f:
+            f.truncate(size)
+        raise
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Normalize exported JSON into normalized_csv/.")
+    ap.add_argument("--db", help="also load the tables into this SQLite (.sqlite/.db) or DuckDB (.duckdb) file")
+    ap.add_argument("--bloom", help="persistent Bloom filter of already-emitted interactions (incremental exports only)")
+    ap.add_argument("--bloom-capacity", type=int, default=1_000_000)
+    ap.add_argument("--workers", type=int, default=1, help="processes decoding export shards in parallel")
+    args = ap.parse_args(argv)
+    metrics.reset()
     OUTPUT_DIR.mkdir(exist_ok=True)
-    recipes_raw = load_json("recipes.json")
-    inter_raw = load_json("interactions.json")
-
-    print(f"Loaded {len(recipes_raw)} recipes and {len(inter_raw)} interactions")
-
-    df_recipes, df_ingredients, df_steps = normalize_recipes(recipes_raw)
-    df_interactions = normalize_interactions(inter_raw)
+    with metrics.stage("load_records") as st:
+        with metrics.stage("recipes") as sub:
+            recipes = load_json("recipes", args.workers)
+            sub.rows_out = len(recipes)
+        parse_timing(reset=True)
+        with metrics.stage("interactions") as sub:
+            interactions = load_json("interactions", args.workers)
+            sub.rows_out = len(interactions)
+        # timestamps are parsed while decoding (summed over decode workers), reported on their own
+        timing = parse_timing(reset=True)
+        metrics.add_stage("parse_timestamps", timing["seconds"], rows_in=timing["rows"], rows_out=timing["parsed"])
+        st.rows_out = len(recipes) + len(interactions)
+
+    print(f"Loaded {len(recipes)} recipes and {len(interactions)} interactions")
+
+    with metrics.stage("normalize_recipes", rows_in=len(recipes)) as st:
+        df_recipes, df_ingredients, df_steps = normalize_recipes(recipes)
+        st.rows_out = len(df_recipes)
+    with metrics.stage("normalize_interactions", rows_in=len(interactions)) as st:
+        df_interactions = normalize_interactions(interactions)
+        st.rows_out = len(df_interactions)
+
+    # With an existing Bloom filter only unseen interactions are emitted, so they are
+    # appended to interactions.csv rather than replacing it
+    append = bool(args.bloom) and Path(args.bloom).exists()
+    if append and not (OUTPUT_DIR / "interactions.csv").exists():
+        raise SystemExit(f"{args.bloom} exists but {OUTPUT_DIR / 'interactions.csv'} does not; "
+                         "delete the filter to rebuild from the full export")
+
+    with metrics.stage("dedup_interactions", rows_in=len(df_interactions)) as st:
+        bloom = BloomFilter.load_or_create(args.bloom, capacity=args.bloom_capacity) if args.bloom else None
+        df_interactions, dedup_stats = deduplicate_interactions(df_interactions, bloom=bloom)
+        st.rows_out = len(df_interactions)
+        st.extra.update(dedup_stats)
+    print(f"Deduplicated interactions: {dedup_stats['rows_in']} -> {dedup_stats['rows_out']} "
+          f"(dropped {dedup_stats['dropped_in_run']} duplicates in this export, "
+          f"{dedup_stats['dropped_seen_before']} seen in earlier runs)")
+    if dedup_stats["id_conflicts"]:
+        print(f"Kept {dedup_stats['id_conflicts']} interactions whose interaction_id is reused with different "
+              f"content, e.g. {', '.join(dedup_stats['id_conflict_examples'])}")
 
     # Optional cleaning steps:
-    # - Drop recipes without recipe_id
-    df_recipes = df_recipes[df_recipes["recipe_id"].notnull()]
-
-    # - Ensure interactions refer to existing recipes (inner join)
-    valid_recipe_ids = set(df_recipes["recipe_id"].unique())
-    before = len(df_interactions)
-    df_interactions = df_interactions[df_interactions["recipe_id"].isin(valid_recipe_ids)]
-    after = len(df_interactions)
+    with metrics.stage("filter", rows_in=len(df_recipes) + len(df_interactions)) as st:
+        # - Drop recipes without recipe_id
+        df_recipes = df_recipes[df_recipes["recipe_id"].notnull()]
+
+        # - Ensure interactions refer to existing recipes (inner join)
+        valid_recipe_ids = set(df_recipes["recipe_id"].unique())
+        before = len(df_interactions)
+        df_interactions = df_interactions[df_interactions["recipe_id"].isin(valid_recipe_ids)]
+        after = len(df_interactions)
+        st.rows_out = len(df_recipes) + after
     print(f"Filtered interactions: {before} -> {after} (only those with recipe present)")
 
     # Write CSVs
-    df_recipes.to_csv(OUTPUT_DIR / "recipes.csv", index=False)
-    df_ingredients.to_csv(OUTPUT_DIR / "ingredients.csv", index=False)
-    df_steps.to_csv(OUTPUT_DIR / "steps.csv", index=False)
-    df_interactions.to_csv(OUTPUT_DIR / "interactions.csv", index=False)
+    with metrics.stage("write_csv") as st:
+        df_recipes.to_csv(OUTPUT_DIR / "recipes.csv", index=False)
+        df_ingredients.to_csv(OUTPUT_DIR / "ingredients.csv", index=False)
+        df_steps.to_csv(OUTPUT_DIR / "steps.csv", index=False)
+        if append:
+            append_csv(df_interactions, OUTPUT_DIR / "interactions.csv")
+        else:
+            df_interactions.to_csv(OUTPUT_DIR / "interactions.csv", index=False)
+        st.rows_out = len(df_recipes) + len(df_ingredients) + len(df_steps) + len(df_interactions)
 
-    print("Wrote CSVs to normalized_csv/")
+    if append:
+        print(f"Wrote CSVs to normalized_csv/ ({len(df_interactions)} new interactions appended)")
+    else:
+        print("Wrote CSVs to normalized_csv/")
+
+    # only rows that made it into the output are remembered, and only once it is written
+    if bloom is not None:
+        with metrics.stage("save_bloom", rows_in=len(df_interactions)):
+            remember_interactions(bloom, df_interactions)
+            bloom.save(args.bloom)
+
+    if args.db:
+        import sql_store
+        with metrics.stage("load_sql_store") as st:
+            if append:
+                # df_interactions holds only the new rows; load the whole tables
+                conn, engine = sql_store.load_csv_dir(args.db, OUTPUT_DIR)
+            else:
+                conn, engine = sql_store.load_frames(args.db, {
+                    "recipes": df_recipes,
+                    "ingredients": df_ingredients,
+                    "steps": df_steps,
+                    "interactions": df_interactions,
+                })
+            st.rows_out = sum(sql_store.table_counts(conn).values())
+            conn.close()
+        print(f"Loaded tables into {args.db} ({engine})")
+    metrics.print_summary()
+    metrics.write()
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,6 @@
 # upload_pav_bhaji.py
-import json
-from firebase_admin import credentials, initialize_app, firestore
-
-# Change this filename if your service account key has a different name
-SERVICE_ACCOUNT_PATH = "serviceAccountKey.json"
-
-cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-initialize_app(cred)
-db = firestore.client()
+import argparse
+from firestore_client import get_db
 
 pav_bhaji = {
     "recipe_id": "pav-bhaji-001",
@@ -43,7 +36,13 @@ pav_bhaji = {
     "updated_at": "2025-11-17T08:00:00Z"
 }
 
-# Write to `recipes` collection with ID pav-bhaji-001
-doc_ref = db.collection("recipes").document(pav_bhaji["recipe_id"])
-doc_ref.set(pav_bhaji)
-print("Inserted Pav Bhaji recipe to Firestore.")
+def main(argv=None):
+    argparse.ArgumentParser(description="Upload the Pav Bhaji recipe to Firestore.").parse_args(argv)
+    db = get_db()
+    # Write to `recipes` collection with ID pav-bhaji-001
+    doc_ref = db.collection("recipes").document(pav_bhaji["recipe_id"])
+    doc_ref.set(pav_bhaji)
+    print("Inserted Pav Bhaji recipe to Firestore.")
+
+if __name__ == "__main__":
+    main()